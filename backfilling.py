@@ -1,145 +1,225 @@
 import pandas as pd
-import requests
-import base64
-from PIL import Image
-from io import BytesIO
 import time
-from multiprocessing.pool import ThreadPool
+from collections import namedtuple
 import get_llm
 import get_embeddings
-import traceback
+import http_client
+import images
+import result_cache
 import os
+import argparse
 from tqdm import tqdm
-from milvus.store import MilvusDualClient
-
-# Initialize Milvus client
-print("Connecting to Milvus...")
-milvus_client = MilvusDualClient(
-    host="localhost", 
-    port="19530", 
-    text_collection_name="fashion_items_text", 
-    image_collection_name="fashion_items_image"
-)
-
-# Load collections once at startup
-print("Loading collections...")
-try:
-    try:
-        milvus_client.text_collection.release()
-    except Exception as e:
-        print(f"Collection release error (expected if not loaded): {str(e)}")
-    
-    milvus_client.text_collection.load()
-    print("Text collection loaded successfully!")
-        
-except Exception as e:
-    print(f"Error during collection loading: {str(e)}")
-    print("Continuing with caution - some operations may fail")
+from milvus.store import create_client, BufferedMilvusWriter
+from pipeline import Stage, Pipeline
 
-def entity_exists(client, product_id):
-    try:
-        expr = f'product_id == "{product_id}"'
-        results = client.text_collection.query(expr, output_fields=["product_id"], limit=1)
-        return len(results) > 0
-    except Exception as e:
-        print(f"Error checking if entity exists for {product_id}: {str(e)}")
-        return False
+parser = argparse.ArgumentParser(description="Backfill fashion products into Milvus")
+parser.add_argument("--csv", default="fashion_products.csv", help="Product catalogue export")
+parser.add_argument("--chunksize", type=int, default=10000, help="CSV rows read per chunk")
+parser.add_argument("--fetch-workers", type=int, default=16, help="Concurrent image downloads")
+parser.add_argument("--llm-workers", type=int, default=16, help="Concurrent LLM requests")
+parser.add_argument("--embed-workers", type=int, default=32,
+                    help="Concurrent embedding callers; micro-batched only with EMBEDDING_BATCH_IMAGES=1")
+parser.add_argument("--queue-size", type=int, default=200, help="Max items waiting in front of each stage")
+parser.add_argument("--report-interval", type=float, default=30,
+                    help="Seconds between per-stage throughput reports (0 to disable)")
+parser.add_argument("--resume", action=argparse.BooleanOptionalAction, default=True,
+                    help="Skip products already stored in both collections (default: on)")
+parser.add_argument("--write-batch", type=int, default=500, help="Products per columnar insert")
 
-print("Loading product data...")
-df = pd.read_csv('fashion_products.csv')
-print(f"Loaded {len(df)} products from CSV")
+# Set up by main(), or by a caller driving the stages itself (e2e_benchmark.py)
+milvus_client = None
+writer = None
 
-def encode_image(image_url):
-    try:
-        response = requests.get(image_url, timeout=10)
-        if response.status_code != 200:
-            raise Exception(f"Failed to fetch image from URL: {image_url}")
-        image = Image.open(BytesIO(response.content)).convert("RGB")
-        buffered = BytesIO()
-        image.save(buffered, format="PNG")
-        return base64.b64encode(buffered.getvalue()).decode("utf-8")
-    except requests.exceptions.RequestException as e:
-        raise Exception(f"Request error for URL {image_url}: {str(e)}")
+def open_store():
+    # Initialize Milvus client (or the embedded store with VECTOR_BACKEND=local)
+    print("Connecting to Milvus...")
+    client = create_client(
+        host="localhost", 
+        port="19530", 
+        text_collection_name="fashion_items_text", 
+        image_collection_name="fashion_items_image"
+    )
 
-def process_row(row):
-    image_url = row['image']
+    # Load collections once at startup
+    print("Loading collections...")
     try:
-        product_id = str(row['product_base_id'])
-        
         try:
-            if entity_exists(milvus_client, product_id):
-                print(f"Product {product_id} already exists in the database. Skipping.")
-                return []
+            client.text_collection.release()
         except Exception as e:
-            print(f"Error in exists check for {product_id}: {str(e)}")
-            print("Continuing with insertion...")
-        
-        print(f"Processing product {product_id}...")
+            print(f"Collection release error (expected if not loaded): {str(e)}")
         
-        try:
-            image_b64 = encode_image(image_url)
-        except Exception as e:
-            print(f"Error encoding image for {product_id}: {str(e)}")
-            return []
-            
-        try:
-            llm_result = get_llm.query_litellm(
-                text=row['description'],
-                description=row['description'], 
-                image_base64=image_b64
-            )
-
-            # if llm_result.get('sanity_check') == 'no':
-            #     print(f"Failed sanity check for {product_id}")
-            #     return []
+        client.text_collection.load()
+        client.image_collection.load()
+        print("Collections loaded successfully!")
             
-            img_emb, text_emb = get_embeddings.get_embeddings(
-                image_b64,
-                llm_result['description']
-            )
+    except Exception as e:
+        print(f"Error during collection loading: {str(e)}")
+        print("Continuing with caution - some operations may fail")
+    return client
 
-            if img_emb is None or text_emb is None:
-                print(f"Failed to get embeddings for {product_id}")
-                return []
+# Only the columns process_row needs are read; missing optional ones are filled with ''
+ROW_FIELDS = [
+    "product_base_id", "image", "link", "source", "price",
+    "discounted_price", "title", "description", "brand_name",
+]
+ProductRow = namedtuple("ProductRow", ROW_FIELDS)
 
-            category = llm_result.get('dress_category', 'unknown')
-            
-            metadata = {
-                "link": row['link'],
-                "image_url": row['image'],
-                "source": row['source'],
-                "price": row.get('price', ''),
-                "discounted_price": row.get('discounted_price', ''),
-                "title": row.get('title', ''),
-                "description": row.get('description', ''),
-                "brand": row.get('brand_name', ''),
-            }
-
-            try:
-                milvus_client.insert_entity(product_id, text_emb, img_emb, category, metadata)
-                print(f"Successfully inserted {product_id}")
-                return [product_id]
-            except Exception as e:
-                print(f"Error inserting into Milvus for {product_id}: {str(e)}")
-                return []
-                
-        except Exception as e:
-            print(f"Error processing {product_id}: {str(e)}")
-            return []
-    
+def stored_ids(client):
+    # Pull every stored product_id once instead of querying Milvus per row
+    print("Fetching stored product ids...")
+    text_ids, image_ids = client.stored_product_ids()
+    completed_ids = text_ids & image_ids
+    # Products present in only one collection were half-written by an
+    # interrupted run; drop them so they are inserted again cleanly
+    partial_ids = text_ids ^ image_ids
+    if partial_ids:
+        print(f"Found {len(partial_ids)} partially written products, removing them")
+        client.delete_entities(partial_ids)
+    print(f"{len(completed_ids)} products already stored")
+    return completed_ids
+
+def iter_product_rows(csv_path, chunksize, skip_ids):
+    """Stream the catalogue in chunks, yielding lightweight ProductRow tuples."""
+    chunks = pd.read_csv(
+        csv_path,
+        usecols=lambda column: column in ROW_FIELDS,
+        # Read ids as text so every chunk yields the same id strings
+        dtype={"product_base_id": str},
+        chunksize=chunksize
+    )
+    for chunk in chunks:
+        chunk = chunk.reindex(columns=ROW_FIELDS, fill_value='')
+        if skip_ids:
+            chunk = chunk[~chunk['product_base_id'].isin(skip_ids)]
+        for values in chunk.itertuples(index=False, name=None):
+            yield ProductRow._make(values)
+
+# Backfill stages. Each takes the work item produced by the previous stage and
+# returns it enriched, or None to drop the product after logging why.
+
+def fetch_stage(row):
+    product_id = str(row.product_base_id)
+    print(f"Processing product {product_id}...")
+    try:
+        image = images.fetch_image(row.image)
+    except Exception as e:
+        print(f"Error fetching image for {product_id}: {str(e)}")
+        return None
+    return {"row": row, "product_id": product_id, "image": image}
+
+def llm_stage(item):
+    row = item["row"]
+    try:
+        llm_result = get_llm.query_litellm(
+            text=row.description,
+            description=row.description, 
+            image_base64=item["image"].base64,
+            image_mime_type=item["image"].mime_type
+        )
     except Exception as e:
-        print(f"Error processing row {row.name} ({product_id if 'product_id' in locals() else 'unknown ID'})")
-        print(traceback.format_exc())
-        return []
+        print(f"Error querying LLM for {item['product_id']}: {str(e)}")
+        return None
+
+    # if llm_result.get('sanity_check') == 'no':
+    #     print(f"Failed sanity check for {item['product_id']}")
+    #     return None
+
+    if not isinstance(llm_result, dict) or 'description' not in llm_result:
+        print(f"Invalid LLM response for {item['product_id']}: {llm_result}")
+        return None
+    item["llm_result"] = llm_result
+    return item
+
+def embed_stage(item):
+    # Workers submit single items; the shared batcher packs them into one request
+    img_emb, text_emb = get_embeddings.get_batcher().embed(
+        item["image"].base64,
+        item["llm_result"]['description']
+    )
+    if img_emb is None or text_emb is None:
+        print(f"Failed to get embeddings for {item['product_id']}")
+        return None
+    # The image is not needed past this point; free it before the write stage
+    del item["image"]
+    item["img_emb"] = img_emb
+    item["text_emb"] = text_emb
+    return item
+
+def write_stage(item):
+    row = item["row"]
+    category = item["llm_result"].get('dress_category', 'unknown')
+
+    metadata = {
+        "link": row.link,
+        "image_url": row.image,
+        "source": row.source,
+        "price": row.price,
+        "discounted_price": row.discounted_price,
+        "title": row.title,
+        "description": row.description,
+        "brand": row.brand_name,
+    }
+
+    writer.add(item["product_id"], item["text_emb"], item["img_emb"], category, metadata)
+    print(f"Queued {item['product_id']} for insertion")
+    return item["product_id"]
+
+def process_row(row):
+    """Run a single row through every stage in the calling thread."""
+    item = row
+    for stage in (fetch_stage, llm_stage, embed_stage, write_stage):
+        item = stage(item)
+        if item is None:
+            return []
+    return [item]
+
+def build_pipeline(args, on_result=None):
+    return Pipeline(
+        [
+            Stage("fetch", fetch_stage, workers=args.fetch_workers, queue_size=args.queue_size),
+            Stage("llm", llm_stage, workers=args.llm_workers, queue_size=args.queue_size),
+            Stage("embed", embed_stage, workers=args.embed_workers, queue_size=args.queue_size),
+            # writer.add only buffers; one thread keeps batches in arrival order
+            Stage("write", write_stage, workers=1, queue_size=args.queue_size),
+        ],
+        on_result=on_result,
+        report_interval=args.report_interval or None
+    )
+
+def main(argv=None):
+    global milvus_client, writer
+    args = parser.parse_args(argv)
+
+    # One keep-alive connection per concurrent worker
+    http_client.configure(pool_size=args.fetch_workers + args.llm_workers + args.embed_workers)
+
+    milvus_client = open_store()
+    # Rows from all workers are gathered here and written in columnar batches,
+    # with a single flush once the backfill is done
+    writer = BufferedMilvusWriter(milvus_client, max_rows=args.write_batch)
+
+    completed_ids = stored_ids(milvus_client) if args.resume else set()
+
+    if not os.path.exists("processed_images"):
+        os.makedirs("processed_images")
+
+    progress = tqdm(desc="Processing products")
+    pipeline = build_pipeline(args, on_result=lambda product_id: progress.update(1))
+
+    print("Streaming product data...")
+    pipeline.run(iter_product_rows(args.csv, args.chunksize, completed_ids))
+    progress.close()
 
-if not os.path.exists("processed_images"):
-    os.makedirs("processed_images")
+    writer.close()
 
-with ThreadPool(30) as pool:
-    results = list(tqdm(
-        pool.imap(process_row, [row for _, row in df.iterrows()]), 
-        total=len(df),
-        desc="Processing products"
-    ))
+    print(pipeline.report())
+    print(f"Processing complete. Successfully processed {pipeline.stages[-1].processed} products.")
+    print(f"Inserted {writer.inserted} products into Milvus ({writer.failed} failed).")
+    if get_embeddings.get_batcher().batches_sent:
+        print(f"Average embedding batch size: {get_embeddings.get_batcher().average_batch_size:.1f}")
+    cache = result_cache.get_cache()
+    if cache is not None:
+        print(f"Result cache: {cache.stats()}")
 
-print(f"Processing complete. Successfully processed {sum(1 for r in results if r)} products.")
+if __name__ == "__main__":
+    main()
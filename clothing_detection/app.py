@@ -1,66 +1,445 @@
 import os
+import fcntl
+import shutil
+import tempfile
 import base64
 import io
+import time
+import queue
+import threading
+from concurrent.futures import Future
+import numpy as np
 from PIL import Image
 import json
 from flask import Flask, request, jsonify
 from huggingface_hub import hf_hub_download
+import torch
 from ultralytics import YOLO
 
 app = Flask(__name__)
 
-model_path = hf_hub_download(repo_id="kesimeg/yolov8n-clothing-detection", 
-                             filename="best.pt",
-                             force_download=True) 
-print(f"Model path: {model_path}")
+MODEL_REPO_ID = "kesimeg/yolov8n-clothing-detection"
+MODEL_FILENAME = "best.pt"
+# Explicit weights file; when set the hub is never contacted
+MODEL_PATH = os.getenv("CLOTHING_MODEL_PATH")
+# Where hub downloads are kept between restarts (default: the HF cache)
+MODEL_CACHE_DIR = os.getenv("CLOTHING_MODEL_CACHE_DIR")
+
+# Concurrent requests are grouped into one batched predict call
+MAX_BATCH_SIZE = int(os.getenv("DETECTION_MAX_BATCH_SIZE", "8"))
+MAX_WAIT_MS = float(os.getenv("DETECTION_MAX_WAIT_MS", "15"))
+# Images are sent at their original size; predict letterboxes them to this
+# size (keeping the aspect ratio) and maps boxes back to original coordinates
+IMGSZ = int(os.getenv("DETECTION_IMGSZ", "640"))
+# Images allowed to wait for or be in inference at once; beyond that requests
+# get a 503 instead of queueing without bound (a single batch larger than this gets a 413)
+MAX_PENDING = int(os.getenv("DETECTION_MAX_PENDING", "64"))
+# torch intra-op threads for this process (0 leaves the torch default)
+TORCH_THREADS = int(os.getenv("DETECTION_TORCH_THREADS", "0"))
+# Inference backend: "torch" (the .pt weights), "onnx", "onnx-int8"
+# (dynamically quantized) or "openvino". Non-torch backends are exported from
+# the .pt weights once and reused on later starts.
+BACKEND = os.getenv("DETECTION_BACKEND", "torch")
+# Where exported models are kept; must be writable (the HF cache may not be)
+EXPORT_DIR = os.getenv(
+    "DETECTION_EXPORT_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "clothing_detection", "exports")
+)
+
+
+class QueueFullError(Exception):
+    pass
+
+
+class BatchTooLargeError(Exception):
+    pass
+
+
+class InferenceCoalescer:
+    """
+    Groups single-image requests into batched MODEL.predict calls.
+
+    Requests arriving within max_wait_ms of the first one (up to
+    max_batch_size images) share one forward pass. All inference runs on the
+    dispatcher thread, so the model is never called from two threads at once.
+    """
+
+    def __init__(self, model, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS, max_pending=MAX_PENDING):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_pending = max_pending
+        self._pending = 0
+        self._pending_lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit_many(self, imgs):
+        """
+        Queue images for inference, or raise QueueFullError if saturated.
+
+        Raises BatchTooLargeError for more images than max_pending, which
+        would never fit however long the caller waited.
+        """
+        if len(imgs) > self.max_pending:
+            raise BatchTooLargeError(
+                f"{len(imgs)} images in one request; at most {self.max_pending} are accepted"
+            )
+        with self._pending_lock:
+            if self._pending + len(imgs) > self.max_pending:
+                raise QueueFullError(f"Inference queue is full ({self._pending} pending)")
+            self._pending += len(imgs)
+        futures = []
+        for img in imgs:
+            future = Future()
+            future.add_done_callback(self._release)
+            self._queue.put((img, future))
+            futures.append(future)
+        return futures
+
+    def submit(self, img):
+        return self.submit_many([img])[0]
+
+    def _release(self, future):
+        with self._pending_lock:
+            self._pending -= 1
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            try:
+                results = self.model.predict([img for img, _ in batch], imgsz=IMGSZ, verbose=False)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+
+MODEL = None
+COALESCER = None
+READY = threading.Event()
+LOAD_ERROR = None
+
+
+def resolve_model_path():
+    """Local weights first; only go to the network if nothing is cached."""
+    if MODEL_PATH:
+        if not os.path.exists(MODEL_PATH):
+            raise FileNotFoundError(f"CLOTHING_MODEL_PATH does not exist: {MODEL_PATH}")
+        return MODEL_PATH
+    try:
+        return hf_hub_download(repo_id=MODEL_REPO_ID,
+                               filename=MODEL_FILENAME,
+                               cache_dir=MODEL_CACHE_DIR,
+                               local_files_only=True)
+    except Exception:
+        print("Model weights not cached locally, downloading from the hub")
+        return hf_hub_download(repo_id=MODEL_REPO_ID,
+                               filename=MODEL_FILENAME,
+                               cache_dir=MODEL_CACHE_DIR)
+
+
+def export_model(weights_path, backend):
+    """
+    Export the .pt weights for a non-torch backend, or reuse an earlier export.
+
+    Ultralytics runs the exported model through the same predict/Results API,
+    so box extraction and the class filter are unchanged. Gunicorn workers
+    start together, so the export runs under a file lock: the first worker
+    exports, the others wait and then load its result. Files are built in a
+    temporary directory and moved into place whole, so a model that exists
+    is never half-written.
+    """
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(weights_path))[0]
+
+    with open(os.path.join(EXPORT_DIR, ".export.lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if backend in ("onnx", "onnx-int8"):
+            onnx_path = os.path.join(EXPORT_DIR, f"{stem}-{IMGSZ}.onnx")
+            if not os.path.exists(onnx_path):
+                print(f"Exporting {weights_path} to ONNX")
+                # dynamic axes so the coalescer can send any batch size
+                _export(weights_path, "onnx", onnx_path)
+            if backend == "onnx":
+                return onnx_path
+
+            int8_path = os.path.join(EXPORT_DIR, f"{stem}-{IMGSZ}-int8.onnx")
+            if not os.path.exists(int8_path):
+                from onnxruntime.quantization import quantize_dynamic, QuantType
+                print(f"Quantizing {onnx_path} to int8")
+                temporary = f"{int8_path}.{os.getpid()}.tmp"
+                quantize_dynamic(onnx_path, temporary, weight_type=QuantType.QUInt8)
+                os.replace(temporary, int8_path)
+            return int8_path
+
+        if backend == "openvino":
+            openvino_dir = os.path.join(EXPORT_DIR, f"{stem}-{IMGSZ}_openvino_model")
+            if not os.path.exists(openvino_dir):
+                print(f"Exporting {weights_path} to OpenVINO")
+                _export(weights_path, "openvino", openvino_dir)
+            return openvino_dir
+
+    raise ValueError(f"Unknown DETECTION_BACKEND: {backend}")
+
+
+def _export(weights_path, export_format, target):
+    # Ultralytics writes the export next to the weights it is given, so it
+    # gets a copy in a scratch directory rather than the (read-only) original
+    scratch = tempfile.mkdtemp(prefix="export-", dir=EXPORT_DIR)
+    try:
+        weights_copy = os.path.join(scratch, os.path.basename(weights_path))
+        shutil.copyfile(weights_path, weights_copy)
+        exported = YOLO(weights_copy).export(format=export_format, imgsz=IMGSZ, dynamic=True)
+        os.replace(exported, target)
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+def load_model():
+    """Load the weights, run a warm-up inference, then mark the service ready."""
+    global MODEL, COALESCER, LOAD_ERROR
+    try:
+        started = time.time()
+        if TORCH_THREADS:
+            torch.set_num_threads(TORCH_THREADS)
+        model_path = resolve_model_path()
+        print(f"Model path: {model_path}")
+
+        if BACKEND != "torch":
+            model_path = export_model(model_path, BACKEND)
+            print(f"Using {BACKEND} model: {model_path}")
+
+        MODEL = YOLO(model_path, task="detect")
+        print("Successfully loaded custom clothing detection model")
+
+        # The first predict builds the predictor and fuses layers; pay that
+        # here instead of on the first real request
+        MODEL.predict(np.zeros((IMGSZ, IMGSZ, 3), dtype=np.uint8), imgsz=IMGSZ, verbose=False)
+
+        COALESCER = InferenceCoalescer(MODEL)
+        READY.set()
+        print(f"Model warmed up and ready in {time.time() - started:.1f}s")
+    except Exception as e:
+        import traceback
+        print(traceback.format_exc())
+        LOAD_ERROR = str(e)
+
+
+# Load in the background so the health endpoints answer while warming up
+threading.Thread(target=load_model, daemon=True).start()
+
+
+def not_ready_response():
+    return jsonify({"error": LOAD_ERROR or "Model is still loading"}), 503
+
+
+def queue_full_response(e):
+    return jsonify({"error": str(e)}), 503, {"Retry-After": "1"}
+
+
+def open_image(image_bytes):
+    # Decode on the request thread so broken images fail with a 400 and the
+    # inference thread only runs the model
+    img = Image.open(io.BytesIO(image_bytes))
+    img.load()
+    return img
+
+
+def decode_image(base64_image):
+    if 'data:image' in base64_image:
+        base64_image = base64_image.split(',')[1]
+    image_bytes = base64.b64decode(base64_image)
+    return open_image(image_bytes)
+
+
+def is_binary_request():
+    return request.mimetype == 'application/octet-stream' or request.mimetype.startswith('image/')
+
+
+def read_images(field):
+    """
+    Decode the images of a request, whichever transport it used:
+    multipart/form-data files under `field`, a raw application/octet-stream
+    (or image/*) body holding a single image, or JSON with base64 under `field`.
+    """
+    if request.mimetype == 'multipart/form-data':
+        return [open_image(upload.read()) for upload in request.files.getlist(field)]
+    if is_binary_request():
+        body = request.get_data()
+        return [open_image(body)] if body else []
+
+    data = request.get_json(silent=True) or {}
+    value = data.get(field)
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = [value]
+    return [decode_image(base64_image) for base64_image in value]
+
+
+def extract_boxes(result):
+    boxes = []
+    for box in result.boxes:
+        x1, y1, x2, y2 = map(int, box.xyxy[0].tolist())
+        conf = float(box.conf[0])
+        cls = int(box.cls[0])
+
+        # If class is clothing item (class 2)
+        if cls == 2:
+            boxes.append({
+                'box': [x1, y1, x2, y2],
+                'confidence': round(conf, 2),
+            })
+    return boxes
+
+
+def crop_detections(img, boxes, padding):
+    """Pad each box (clamped to the image) and attach the crop as base64 JPEG."""
+    rgb = img.convert("RGB")
+    width, height = rgb.size
+    for item in boxes:
+        x1, y1, x2, y2 = item['box']
+        box = [max(0, x1 - padding), max(0, y1 - padding), min(width, x2 + padding), min(height, y2 + padding)]
+        buffered = io.BytesIO()
+        rgb.crop(box).save(buffered, format="JPEG")
+        item['box'] = box
+        item['image'] = base64.b64encode(buffered.getvalue()).decode("utf-8")
+    return boxes
+
+
+def crop_options():
+    """?return_crops=1&padding=N, also accepted as JSON fields."""
+    data = request.get_json(silent=True) if request.is_json else None
+    data = data or {}
+    return_crops = request.args.get('return_crops', data.get('return_crops', False))
+    padding = int(request.args.get('padding', data.get('padding', 5)))
+    return str(return_crops).lower() in ('1', 'true', 'yes'), padding
 
-MODEL = YOLO(model_path)
-print("Successfully loaded custom clothing detection model")
 
 @app.route('/detect_clothing', methods=['POST'])
 def detect_clothing():
-    data = request.json
-    
-    if not data or 'image' not in data:
-        return jsonify({"error": "No image provided"}), 400
-    
+    """
+    Detect clothing in one image.
+
+    Accepts raw bytes (application/octet-stream or image/*), a multipart
+    upload in the `image` field, or JSON {"image": base64}, at any size.
+    Boxes are in original-image coordinates; with return_crops=1 each
+    detection also carries its padded crop.
+    """
+    if not READY.is_set():
+        return not_ready_response()
+
     try:
-        base64_image = data['image']
-        if 'data:image' in base64_image:
-            base64_image = base64_image.split(',')[1]
-        
         try:
-            image_bytes = base64.b64decode(base64_image)
-            img = Image.open(io.BytesIO(image_bytes))
+            imgs = read_images('image')
         except Exception as e:
-            return jsonify({"error": f"Invalid base64 image: {str(e)}"}), 400
-        
-        results = MODEL.predict(img)
-        result = results[0]
-        
-        boxes = []
-        for box in result.boxes:
-            x1, y1, x2, y2 = map(int, box.xyxy[0].tolist())
-            conf = float(box.conf[0])
-            cls = int(box.cls[0])
-            
-            # If class is clothing item (class 2)
-            if cls == 2:
-                boxes.append({
-                    'box': [x1, y1, x2, y2],
-                    'confidence': round(conf, 2),
-                })
-        
+            return jsonify({"error": f"Invalid image: {str(e)}"}), 400
+
+        if not imgs:
+            return jsonify({"error": "No image provided"}), 400
+        img = imgs[0]
+
+        return_crops, padding = crop_options()
+        try:
+            future = COALESCER.submit(img)
+        except QueueFullError as e:
+            return queue_full_response(e)
+        result = future.result()
+        boxes = extract_boxes(result)
+        if return_crops:
+            crop_detections(img, boxes, padding)
+
         return jsonify({
             "success": True,
             "items_detected": len(boxes),
             "detections": boxes
         })
-    
+
+    except Exception as e:
+        import traceback
+        print(traceback.format_exc())
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/detect_clothing_batch', methods=['POST'])
+def detect_clothing_batch():
+    """
+    Detect clothing in several images at once.
+
+    Body: multipart/form-data with one file per image in the `images` field,
+    or JSON {"images": [base64, ...]}. Returns one entry per image, in order,
+    with the same fields as /detect_clothing.
+    """
+    if not READY.is_set():
+        return not_ready_response()
+
+    try:
+        try:
+            imgs = read_images('images')
+        except Exception as e:
+            return jsonify({"error": f"Invalid image: {str(e)}"}), 400
+
+        if not imgs:
+            return jsonify({"error": "No images provided"}), 400
+
+        return_crops, padding = crop_options()
+        try:
+            futures = COALESCER.submit_many(imgs)
+        except BatchTooLargeError as e:
+            return jsonify({"error": str(e)}), 413
+        except QueueFullError as e:
+            return queue_full_response(e)
+        results = []
+        for img, future in zip(imgs, futures):
+            boxes = extract_boxes(future.result())
+            if return_crops:
+                crop_detections(img, boxes, padding)
+            results.append({
+                "items_detected": len(boxes),
+                "detections": boxes
+            })
+
+        return jsonify({
+            "success": True,
+            "results": results
+        })
+
     except Exception as e:
         import traceback
         print(traceback.format_exc())
         return jsonify({"error": str(e)}), 500
 
+
+@app.route('/health', methods=['GET'])
+def health():
+    """Liveness: the process is up, even if the model is still loading."""
+    return jsonify({"status": "ok"}), 200
+
+
+@app.route('/ready', methods=['GET'])
+def ready():
+    """Readiness: 200 only once the model is loaded and warmed up."""
+    if READY.is_set():
+        return jsonify({"status": "ready"}), 200
+    if LOAD_ERROR:
+        return jsonify({"status": "failed", "error": LOAD_ERROR}), 503
+    return jsonify({"status": "loading"}), 503
+
 if __name__ == "__main__":
-    app.run(debug=True, host='0.0.0.0', port=6000) 
\ No newline at end of file
+    # Development server; for production run
+    #   gunicorn -c gunicorn.conf.py app:app
+    app.run(debug=True, host='0.0.0.0', port=6000)
\ No newline at end of file
@@ -0,0 +1,45 @@
+# Production serving for the clothing detection API:
+#
+#   cd clothing_detection && gunicorn -c gunicorn.conf.py app:app
+#
+# Each worker process loads its own model copy and is pinned to its own set of
+# cores, with torch limited to that many intra-op threads, so workers don't
+# fight over the same CPUs. All settings can be overridden via environment.
+import os
+
+_available_cpus = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+
+# Cores given to each worker (and its torch thread pool)
+cores_per_worker = int(os.getenv("DETECTION_CORES_PER_WORKER", "2"))
+workers = int(os.getenv("DETECTION_WORKERS", str(max(1, len(_available_cpus) // cores_per_worker))))
+
+# HTTP threads per worker; they only decode images and wait on the worker's
+# inference thread, which keeps the bounded queue (DETECTION_MAX_PENDING)
+worker_class = "gthread"
+threads = int(os.getenv("DETECTION_HTTP_THREADS", "8"))
+
+bind = os.getenv("DETECTION_BIND", "0.0.0.0:6000")
+timeout = int(os.getenv("DETECTION_TIMEOUT", "120"))
+# Every worker must import the app itself: the model loader runs in a thread,
+# and threads do not survive fork
+preload_app = False
+
+
+def pre_fork(server, worker):
+    # Runs in the master. A replacement worker takes over the slot (and so
+    # the cores) of the one that exited
+    used = {getattr(w, "cpu_slot", None) for w in server.WORKERS.values()}
+    free = [slot for slot in range(workers) if slot not in used]
+    worker.cpu_slot = free[0] if free else 0
+
+
+def post_fork(server, worker):
+    start = (worker.cpu_slot * cores_per_worker) % len(_available_cpus)
+    cpus = [_available_cpus[(start + i) % len(_available_cpus)] for i in range(cores_per_worker)]
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+    # Read by app.load_model and by the OpenMP runtime when torch is imported
+    os.environ.setdefault("DETECTION_TORCH_THREADS", str(cores_per_worker))
+    os.environ.setdefault("OMP_NUM_THREADS", str(cores_per_worker))
+    server.log.info(f"Worker {worker.pid} (slot {worker.cpu_slot}) pinned to CPUs {cpus}")
+
@@ -0,0 +1,290 @@
+"""
+End-to-end throughput benchmark of the backfill and of pin processing,
+with every external dependency replaced by a local stand-in:
+
+    python e2e_benchmark.py --products 2000 --pins 200 --pin-threads 5 \
+        --llm-latency-ms 800 --llm-error-rate 0.01 --output run.json
+
+The detection, LLM, embedding and image services come from fake_services.py
+(in a child process, so they don't compete for this process's GIL), and the
+embedded vector store (milvus.local) stands in for Milvus. The backfill runs
+backfilling.py's stage pipeline over a generated catalogue; pins then go
+through pinterest_scraper_test.process_pin at a fixed thread count, the same
+fan-out the streaming backend uses, searching the products just stored.
+
+Reported: products/sec, pins/sec, per-stage latency histograms (p50/p99),
+the fake services' request and error counts, and peak RSS. Re-run with
+different worker counts, batch sizes or caches to compare.
+"""
+import os
+import sys
+import csv
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import resource
+import contextlib
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+import fake_services
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def write_catalogue(path, count, image_base_url):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["product_base_id", "image", "link", "source", "price", "discounted_price",
+                         "title", "description", "brand_name"])
+        for index in range(count):
+            writer.writerow([
+                f"bench{index}",
+                f"{image_base_url}/{index}.jpg",
+                f"https://example.com/products/{index}",
+                f"source{index % 5}",
+                f"{1000 + index % 4000}",
+                f"{800 + index % 3000}",
+                f"Product {index}",
+                f"Benchmark product {index}, style {index % 37}",
+                f"brand{index % 50}",
+            ])
+
+
+def make_pins(count, image_base_url, offset):
+    # Same fields scrape_pinterest_board returns; images not in the catalogue
+    return [
+        {
+            "id": f"pin{index}",
+            "image_url": f"{image_base_url}/{offset + index}.jpg",
+            "title": f"Pin {index}",
+            "link": f"https://pinterest.com/pin/{index}/",
+        }
+        for index in range(count)
+    ]
+
+
+class _Timed:
+    """Record the latency of every call to func into a histogram."""
+
+    def __init__(self, func, histogram):
+        self.func = func
+        self.histogram = histogram
+
+    def __call__(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self.func(*args, **kwargs)
+        finally:
+            self.histogram.record(time.perf_counter() - start)
+
+
+@contextlib.contextmanager
+def timed_calls(targets, histograms):
+    """Temporarily wrap (owner, attribute) pairs so their calls are timed per stage."""
+    originals = []
+    for name, (owner, attribute) in targets.items():
+        original = getattr(owner, attribute)
+        originals.append((owner, attribute, original))
+        setattr(owner, attribute, _Timed(original, histograms[name]))
+    try:
+        yield
+    finally:
+        for owner, attribute, original in originals:
+            setattr(owner, attribute, original)
+
+
+def histogram_summary(histogram):
+    return {
+        "count": histogram.total,
+        "p50_ms": histogram.percentile(50),
+        "p99_ms": histogram.percentile(99),
+        "buckets": histogram.buckets(),
+    }
+
+
+def run_backfill(args, client):
+    import backfilling
+    from milvus.store import BufferedMilvusWriter
+
+    catalogue = os.path.join(args.workdir, "catalogue.csv")
+    write_catalogue(catalogue, args.products, args.urls["images"])
+    backfill_args = backfilling.parser.parse_args([
+        "--csv", catalogue,
+        "--fetch-workers", str(args.fetch_workers),
+        "--llm-workers", str(args.llm_workers),
+        "--embed-workers", str(args.embed_workers),
+        "--queue-size", str(args.queue_size),
+        "--write-batch", str(args.write_batch),
+        "--report-interval", "0",
+    ])
+    backfilling.milvus_client = client
+    backfilling.writer = BufferedMilvusWriter(client, max_rows=backfill_args.write_batch)
+
+    pipeline = backfilling.build_pipeline(backfill_args)
+    started = time.perf_counter()
+    pipeline.run(backfilling.iter_product_rows(catalogue, backfill_args.chunksize, set()))
+    backfilling.writer.close()
+    elapsed = time.perf_counter() - started
+
+    return {
+        "products": args.products,
+        "inserted": backfilling.writer.inserted,
+        "failed": backfilling.writer.failed,
+        "seconds": elapsed,
+        "products_per_sec": backfilling.writer.inserted / elapsed,
+        "stages": {
+            stage.name: dict(histogram_summary(stage.latency), dropped=stage.dropped, errors=stage.errors)
+            for stage in pipeline.stages
+        },
+        "report": pipeline.report(),
+    }
+
+
+def run_pins(args, client):
+    import images
+    import get_clothing
+    import get_llm
+    import get_embeddings
+    import pinterest_scraper_test
+    from pipeline import LatencyHistogram
+    from milvus.fetch import MilvusDualSearch
+
+    search_client = MilvusDualSearch(client.text_collection, client.image_collection)
+    search_client.ensure_loaded()
+    pins = make_pins(args.pins, args.urls["images"], offset=args.products)
+
+    stages = ("fetch", "detect", "llm", "embed", "search", "pin")
+    histograms = {name: LatencyHistogram() for name in stages}
+    targets = {
+        "fetch": (images, "fetch_image"),
+        "detect": (get_clothing, "detect_clothing_from_file"),
+        "llm": (get_llm, "query_litellm"),
+        "embed": (get_embeddings.get_batcher(), "embed"),
+        "search": (search_client, "fusion_search_batch"),
+    }
+    process_pin = _Timed(pinterest_scraper_test.process_pin, histograms["pin"])
+
+    with timed_calls(targets, histograms):
+        started = time.perf_counter()
+        with ThreadPool(args.pin_threads) as pool:
+            results = list(pool.imap(lambda pin: process_pin(pin, search_client), pins))
+        elapsed = time.perf_counter() - started
+
+    matched = sum(1 for result in results if result)
+    return {
+        "pins": len(pins),
+        "pins_with_matches": matched,
+        "seconds": elapsed,
+        "pins_per_sec": len(pins) / elapsed,
+        "stages": {name: histogram_summary(histograms[name]) for name in stages},
+        "search_cache": search_client.cache_stats(),
+    }
+
+
+def print_stages(title, stages):
+    print(title)
+    for name, summary in stages.items():
+        print(f"  {name:<8} n={summary['count']:<7} p50<={summary['p50_ms']:g}ms  p99<={summary['p99_ms']:g}ms  "
+              f"{json.dumps(summary['buckets'])}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="End-to-end benchmark against local fake services")
+    parser.add_argument("--products", type=int, default=1000, help="Catalogue rows to backfill (0 to skip)")
+    parser.add_argument("--pins", type=int, default=100, help="Pins to process (0 to skip)")
+    parser.add_argument("--pin-threads", type=int, default=5, help="Concurrent pins, as num_threads in the backend")
+    parser.add_argument("--fetch-workers", type=int, default=16)
+    parser.add_argument("--llm-workers", type=int, default=16)
+    parser.add_argument("--embed-workers", type=int, default=32)
+    parser.add_argument("--queue-size", type=int, default=200)
+    parser.add_argument("--write-batch", type=int, default=500)
+    parser.add_argument("--embed-batch", type=int, default=16, help="EMBEDDING_MAX_BATCH_SIZE")
+    parser.add_argument("--batch-images", action="store_true", help="EMBEDDING_BATCH_IMAGES")
+    parser.add_argument("--result-cache", action="store_true", help="Enable the LLM/embedding result cache")
+    parser.add_argument("--search-cache", action="store_true", help="Enable the query result cache")
+    parser.add_argument("--vector-dtype", default="float32", help="Embedded store dtype (float32 or float16)")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--verbose", action="store_true", help="Keep the pipelines' per-item output")
+    fake_services.add_arguments(parser)
+    args = parser.parse_args(argv)
+
+    args.workdir = tempfile.mkdtemp(prefix="e2e_benchmark_")
+    context = multiprocessing.get_context("spawn")
+    connection, child_connection = context.Pipe()
+    services = context.Process(
+        target=fake_services.run_in_process,
+        args=(fake_services.config_from_args(args), child_connection),
+        daemon=True
+    )
+    services.start()
+    args.urls = connection.recv()
+
+    # Read at import time by the modules below
+    os.environ.update({
+        "DETECTION_API_URL": args.urls["detection"],
+        "LITELLM_API_BASE": args.urls["llm"],
+        "LITELLM_API_KEY": "benchmark",
+        "EMBEDDING_ENDPOINT": args.urls["embedding"],
+        "EMBEDDING_MAX_BATCH_SIZE": str(args.embed_batch),
+        "EMBEDDING_BATCH_IMAGES": "1" if args.batch_images else "",
+        "RESULT_CACHE_PATH": os.path.join(args.workdir, "results.sqlite3"),
+        "SEARCH_CACHE_SIZE": os.getenv("SEARCH_CACHE_SIZE", "10000") if args.search_cache else "0",
+    })
+    if not args.result_cache:
+        os.environ["RESULT_CACHE_DISABLED"] = "1"
+
+    import http_client
+    from milvus.store import create_client
+
+    http_client.configure(pool_size=max(
+        args.fetch_workers + args.llm_workers + args.embed_workers,
+        args.pin_threads * 4
+    ))
+    results = {"config": {key: value for key, value in vars(args).items() if key not in ("urls", "workdir")}}
+    output = sys.stdout if args.verbose else open(os.devnull, "w")
+    try:
+        client = create_client(
+            backend="local",
+            local_path=os.path.join(args.workdir, "vectors"),
+            dtype=args.vector_dtype
+        )
+        if args.products:
+            print(f"Backfilling {args.products} products...")
+            with contextlib.redirect_stdout(output):
+                results["backfill"] = run_backfill(args, client)
+            results["backfill"]["peak_rss_mb"] = peak_rss_mb()
+            print(results["backfill"].pop("report"))
+            print(f"Backfill: {results['backfill']['products_per_sec']:.1f} products/sec "
+                  f"({results['backfill']['inserted']} inserted, {results['backfill']['failed']} failed)")
+            print_stages("Backfill stage latency:", results["backfill"]["stages"])
+        if args.pins:
+            print(f"Processing {args.pins} pins with {args.pin_threads} threads...")
+            with contextlib.redirect_stdout(output):
+                results["pins"] = run_pins(args, client)
+            results["pins"]["peak_rss_mb"] = peak_rss_mb()
+            print(f"Pins: {results['pins']['pins_per_sec']:.2f} pins/sec "
+                  f"({results['pins']['pins_with_matches']}/{results['pins']['pins']} with matches)")
+            print_stages("Pin stage latency:", results["pins"]["stages"])
+    finally:
+        connection.send("stop")
+        results["services"] = connection.recv()
+        services.join(timeout=10)
+        shutil.rmtree(args.workdir, ignore_errors=True)
+
+    results["peak_rss_mb"] = peak_rss_mb()
+    print(f"Fake service requests: {json.dumps(results['services'])}")
+    print(f"Peak RSS: {results['peak_rss_mb']:.0f} MB")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Wrote results to {args.output}")
+    return results
+
+
+if __name__ == "__main__":
+    main()
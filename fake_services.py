@@ -0,0 +1,325 @@
+"""
+Local stand-ins for every external service the pipelines call, for
+benchmarks and offline runs:
+
+    detection   POST /detect_clothing        (the clothing_detection API)
+    llm         POST /v1/chat/completions    (the LiteLLM gateway)
+    embedding   POST /                       (the image/text embedding endpoint)
+    images      GET  /images/<n>.jpg         (the product / pin image host)
+
+Each service has its own latency (mean and jitter) and error rate, and
+counts its requests at GET /stats. Responses have the same shape as the
+real services; embeddings are deterministic per input and fall into a few
+clusters, so searches over products embedded here find real matches.
+
+    python fake_services.py --llm-latency-ms 800 --llm-error-rate 0.01
+
+prints the URLs to point DETECTION_API_URL, LITELLM_API_BASE,
+EMBEDDING_ENDPOINT and the image URLs at.
+"""
+import io
+import json
+import base64
+import time
+import random
+import zlib
+import argparse
+import threading
+from dataclasses import dataclass, field
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import numpy as np
+from PIL import Image
+
+EMBEDDING_DIM = 768
+EMBEDDING_CLUSTERS = 64
+# Spread of the members of a cluster; cosine within a cluster is about 1 / (1 + spread^2)
+EMBEDDING_SPREAD = 0.5
+CATEGORIES = ("top", "bottom", "one piece", "full set")
+
+
+@dataclass
+class ServiceConfig:
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    error_rate: float = 0.0
+
+    def delay(self):
+        seconds = max(0.0, random.gauss(self.latency_ms, self.jitter_ms)) / 1000
+        if seconds:
+            time.sleep(seconds)
+
+    def fail(self):
+        return self.error_rate > 0 and random.random() < self.error_rate
+
+
+@dataclass
+class FakeServicesConfig:
+    detection: ServiceConfig = field(default_factory=lambda: ServiceConfig(40, 10))
+    llm: ServiceConfig = field(default_factory=lambda: ServiceConfig(800, 200))
+    embedding: ServiceConfig = field(default_factory=lambda: ServiceConfig(60, 15))
+    images: ServiceConfig = field(default_factory=lambda: ServiceConfig(30, 10))
+    # Boxes returned for every image by the detection service
+    detections: int = 2
+    # Distinct base images served; every URL still gets unique bytes
+    image_variants: int = 16
+    image_size: tuple = (600, 800)
+    # Accept "image": [...] batches; off answers them with 400, like an endpoint without batching
+    image_lists: bool = True
+    host: str = "127.0.0.1"
+
+
+def _vector(key, centers):
+    seed = zlib.crc32(key.encode("utf-8") if isinstance(key, str) else key)
+    rng = np.random.default_rng(seed)
+    vector = centers[seed % len(centers)] + rng.normal(size=centers.shape[1]) * EMBEDDING_SPREAD / np.sqrt(centers.shape[1])
+    return (vector / np.linalg.norm(vector)).astype(np.float32)
+
+
+def _make_images(count, size):
+    images = []
+    rng = np.random.default_rng(0)
+    width, height = size
+    for index in range(count):
+        # Smooth gradient plus a few blocks; compresses like a photo, not like noise
+        x = np.linspace(0, 1, width)[None, :, None]
+        y = np.linspace(0, 1, height)[:, None, None]
+        colours = rng.uniform(0, 255, size=(2, 3))
+        pixels = (colours[0] * x + colours[1] * y) / 2 + rng.normal(0, 6, size=(height, width, 3))
+        for _ in range(4):
+            x1, y1 = rng.integers(0, width // 2), rng.integers(0, height // 2)
+            pixels[y1:y1 + height // 3, x1:x1 + width // 3] = rng.uniform(0, 255, size=3)
+        buffered = io.BytesIO()
+        Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(buffered, format="JPEG", quality=85)
+        images.append(buffered.getvalue())
+    return images
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # Keep-alive, like the real services behind a load balancer
+    protocol_version = "HTTP/1.1"
+    service = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _send(self, status, body, content_type="application/json"):
+        if not isinstance(body, bytes):
+            body = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self, method):
+        service = self.service
+        path = self.path.split("?", 1)[0]
+        if method == "GET" and path == "/stats":
+            self._send(200, service.stats())
+            return
+        body = self._body() if method == "POST" else b""
+        service.config.delay()
+        if service.config.fail():
+            service.count(error=True)
+            self._send(500, {"error": "injected failure"})
+            return
+        try:
+            status, response, content_type = service.respond(method, path, self.headers, body)
+        except Exception as e:
+            status, response, content_type = 400, {"error": str(e)}, "application/json"
+        service.count(error=status >= 400)
+        self._send(status, response, content_type)
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+
+class _Service:
+    def __init__(self, name, config, services):
+        self.name = name
+        self.config = config
+        self.services = services
+        self.requests = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def count(self, error=False):
+        with self._lock:
+            self.requests += 1
+            self.errors += int(error)
+
+    def stats(self):
+        with self._lock:
+            return {"service": self.name, "requests": self.requests, "errors": self.errors}
+
+
+class _DetectionService(_Service):
+    def respond(self, method, path, headers, body):
+        if headers.get("Content-Type", "").startswith("application/json"):
+            data = base64.b64decode(json.loads(body)["image"])
+        else:
+            data = body
+        # Only the header is parsed, like the real service before letterboxing
+        width, height = Image.open(io.BytesIO(data)).size
+        rng = random.Random(zlib.crc32(data[-64:]))
+        detections = []
+        for _ in range(self.services.config.detections):
+            x1, y1 = rng.uniform(0, width * 0.5), rng.uniform(0, height * 0.5)
+            x2, y2 = x1 + rng.uniform(0.2, 0.5) * width, y1 + rng.uniform(0.2, 0.5) * height
+            detections.append({
+                "box": [x1, y1, min(x2, width), min(y2, height)],
+                "confidence": rng.uniform(0.5, 0.99),
+                "class": rng.randint(0, 12),
+            })
+        return 200, {"detections": detections}, "application/json"
+
+
+class _LLMService(_Service):
+    def respond(self, method, path, headers, body):
+        request = json.loads(body)
+        image_url = next(
+            part["image_url"]["url"]
+            for part in request["messages"][0]["content"]
+            if part.get("type") == "image_url"
+        )
+        seed = zlib.crc32(image_url[-256:].encode("utf-8"))
+        category = CATEGORIES[seed % len(CATEGORIES)]
+        content = {
+            "dress_category": category,
+            "description": f"{category}, colour {seed % 17}, pattern {seed % 7}, detail {seed % 23}",
+            "short_text": f"{category} item {seed % 100}",
+        }
+        return 200, {
+            "model": request.get("model"),
+            "choices": [{"message": {"role": "assistant", "content": f"```json\n{json.dumps(content)}\n```"}}],
+        }, "application/json"
+
+
+class _EmbeddingService(_Service):
+    def respond(self, method, path, headers, body):
+        request = json.loads(body)
+        centers = self.services.centers
+        texts = request["text"]
+        if isinstance(request["image"], list):
+            if not self.services.config.image_lists:
+                return 400, {"error": "image must be a base64 string"}, "application/json"
+            image_features = [_vector(image[-256:], centers).tolist() for image in request["image"]]
+        else:
+            image_features = _vector(request["image"][-256:], centers).tolist()
+        text_features = [_vector(text, centers).tolist() for text in texts]
+        return 200, {"image_features": image_features, "text_features": text_features}, "application/json"
+
+
+class _ImageService(_Service):
+    def respond(self, method, path, headers, body):
+        name = path.rsplit("/", 1)[-1].split(".", 1)[0]
+        index = int(name) if name.isdigit() else zlib.crc32(name.encode("utf-8"))
+        images = self.services.images
+        # Decoders stop at the JPEG end marker; the suffix makes every URL's bytes unique
+        return 200, images[index % len(images)] + str(index).encode("ascii"), "image/jpeg"
+
+
+class FakeServices:
+    """Start all four services on free local ports, each in its own server thread."""
+
+    def __init__(self, config=None):
+        self.config = config or FakeServicesConfig()
+        self.centers = np.random.default_rng(1).normal(size=(EMBEDDING_CLUSTERS, EMBEDDING_DIM))
+        self.centers /= np.linalg.norm(self.centers, axis=1, keepdims=True)
+        self.images = _make_images(self.config.image_variants, self.config.image_size)
+        self.services = {
+            "detection": _DetectionService("detection", self.config.detection, self),
+            "llm": _LLMService("llm", self.config.llm, self),
+            "embedding": _EmbeddingService("embedding", self.config.embedding, self),
+            "images": _ImageService("images", self.config.images, self),
+        }
+        self._servers = {}
+        for name, service in self.services.items():
+            handler = type(f"{name.title()}Handler", (_Handler,), {"service": service})
+            server = ThreadingHTTPServer((self.config.host, 0), handler)
+            server.daemon_threads = True
+            server.request_queue_size = 256
+            self._servers[name] = server
+            threading.Thread(target=server.serve_forever, name=f"fake-{name}", daemon=True).start()
+
+    def base_url(self, name):
+        host, port = self._servers[name].server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def urls(self):
+        return {
+            "detection": f"{self.base_url('detection')}/detect_clothing",
+            "llm": self.base_url("llm"),
+            "embedding": f"{self.base_url('embedding')}/",
+            "images": f"{self.base_url('images')}/images",
+        }
+
+    def stats(self):
+        return {name: service.stats() for name, service in self.services.items()}
+
+    def stop(self):
+        for server in self._servers.values():
+            server.shutdown()
+            server.server_close()
+
+
+def run_in_process(config, connection):
+    """multiprocessing target: start the services, send their URLs, serve until told to stop."""
+    services = FakeServices(config)
+    connection.send(services.urls)
+    connection.recv()
+    connection.send(services.stats())
+    services.stop()
+
+
+def add_arguments(parser):
+    """Latency/error options for every service, shared with e2e_benchmark.py."""
+    defaults = FakeServicesConfig()
+    for name in ("detection", "llm", "embedding", "images"):
+        service = getattr(defaults, name)
+        parser.add_argument(f"--{name}-latency-ms", type=float, default=service.latency_ms)
+        parser.add_argument(f"--{name}-jitter-ms", type=float, default=service.jitter_ms)
+        parser.add_argument(f"--{name}-error-rate", type=float, default=service.error_rate)
+    parser.add_argument("--detections", type=int, default=defaults.detections, help="Boxes per image")
+    parser.add_argument("--image-variants", type=int, default=defaults.image_variants)
+    parser.add_argument("--embedding-image-lists", action=argparse.BooleanOptionalAction,
+                        default=defaults.image_lists, help="Whether the embedding service accepts image batches")
+
+
+def config_from_args(args):
+    config = FakeServicesConfig(
+        detections=args.detections,
+        image_variants=args.image_variants,
+        image_lists=args.embedding_image_lists
+    )
+    for name in ("detection", "llm", "embedding", "images"):
+        setattr(config, name, ServiceConfig(
+            getattr(args, f"{name}_latency_ms"),
+            getattr(args, f"{name}_jitter_ms"),
+            getattr(args, f"{name}_error_rate"),
+        ))
+    return config
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run local fakes of the detection, LLM, embedding and image services")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    services = FakeServices(config_from_args(args))
+    for name, url in services.urls.items():
+        print(f"{name:<10} {url}")
+    try:
+        while True:
+            time.sleep(60)
+            print(json.dumps(services.stats()))
+    except KeyboardInterrupt:
+        services.stop()
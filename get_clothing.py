@@ -1,43 +1,117 @@
 import os
 import requests
-import base64
+import http_client
+import images
 import json
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
 from io import BytesIO
 
-def detect_clothing_from_file(base64_image, api_url="http://localhost:6000/detect_clothing"):
-    # Decode and resize the image to ensure consistent dimensions
+# Crops are JPEG-encoded in parallel; Pillow releases the GIL while encoding
+CROP_ENCODE_WORKERS = int(os.getenv("CROP_ENCODE_WORKERS", "4"))
+_crop_executor = ThreadPoolExecutor(max_workers=CROP_ENCODE_WORKERS, thread_name_prefix="crop-encode")
+
+DETECTION_API_URL = os.getenv("DETECTION_API_URL", "http://localhost:6000/detect_clothing")
+
+
+def _scaled_input(payload, target_size, resample, draft):
+    """
+    Return (model_input_image, original_size).
+
+    With draft on and a JPEG source, libjpeg decodes straight to the smallest
+    power-of-two scale that still covers target_size, which is far cheaper than
+    a full decode followed by a resize. The full-resolution decode is left for
+    cropping, and is skipped entirely if nothing is detected.
+    """
+    if draft and payload.mime_type == "image/jpeg":
+        reduced = Image.open(BytesIO(payload.data))
+        original_size = reduced.size
+        reduced.draft("RGB", target_size)
+        return reduced.convert("RGB").resize(target_size, resample), original_size
+    img = payload.image
+    return img.resize(target_size, resample), img.size
+
+
+def _extract_crop(img, box, crop_format):
+    cropped = img.crop(box)
+    if crop_format == "array":
+        return np.asarray(cropped)
+    return images.ImagePayload.from_image(cropped).base64
+
+
+def detect_clothing_from_file(
+    image,
+    api_url=DETECTION_API_URL,
+    transport="binary",
+    client_resize=False,
+    server_crops=False,
+    resample=Image.Resampling.BILINEAR,
+    draft=True,
+    crop_format="jpeg",
+    parallel_crops=True
+):
+    """
+    Detect clothing in an image and return the padded crops.
+
+    `image` is an images.ImagePayload (or a base64 string). By default the
+    original bytes are sent as-is: the service letterboxes the image itself
+    and returns boxes in original-image coordinates, and the image is decoded
+    here at most once, only when there is something to crop.
+    `server_crops` asks the service to cut the padded crops too, so this side
+    does no image work at all.
+    `transport` is "binary" (raw body, the default) or "json" (base64).
+    `client_resize` restores the old behaviour of sending a 640x640 copy;
+    `resample` and `draft` control how that copy is scaled down.
+    `crop_format` is "jpeg" (base64 JPEG strings) or "array" (RGB numpy
+    arrays, for callers that only need the pixels).
+    """
+    padding = 5
+
     try:
-        image_bytes = base64.b64decode(base64_image)
-        img = Image.open(BytesIO(image_bytes)).convert("RGB")
-        
-        # Resize to dimensions that work with the model
-        # YOLOv8 often uses multiples of 32 for width/height
-        # 640x640 is a common input size for YOLOv8
-        target_size = (640, 640)
-        resized_img = img.resize(target_size, Image.Resampling.LANCZOS)
+        payload = images.as_image_payload(image)
         
-        # Re-encode the resized image
-        buffered = BytesIO()
-        resized_img.save(buffered, format="JPEG")
-        resized_base64 = base64.b64encode(buffered.getvalue()).decode("utf-8")
-        
-        # Store original dimensions for scaling bounding boxes back
-        original_width, original_height = img.size
+        if client_resize:
+            # Resize to dimensions that work with the model
+            # YOLOv8 often uses multiples of 32 for width/height
+            # 640x640 is a common input size for YOLOv8
+            target_size = (640, 640)
+            resized_img, (original_width, original_height) = _scaled_input(payload, target_size, resample, draft)
+            
+            # Re-encode the resized image
+            request_image = images.ImagePayload.from_image(resized_img)
+            scale_x = original_width / target_size[0]
+            scale_y = original_height / target_size[1]
+        else:
+            # Only the header is parsed to learn the size
+            original_width, original_height = Image.open(BytesIO(payload.data)).size
+            request_image = payload
+            scale_x = scale_y = 1
     except Exception as e:
         print(f"Error preprocessing image: {str(e)}")
         return []
 
-    payload = {
-        "image": resized_base64
-    }
-    
-    headers = {
-        "Content-Type": "application/json"
-    }
-    
+    params = {"return_crops": 1, "padding": padding} if server_crops and not client_resize else None
+
     try:
-        response = requests.post(api_url, headers=headers, json=payload)
+        if transport == "binary":
+            # Raw bytes skip the base64 inflation and JSON parsing on both ends
+            response = http_client.post(
+                api_url,
+                params=params,
+                headers={"Content-Type": "application/octet-stream"},
+                data=request_image.data
+            )
+        else:
+            body = {
+                "image": request_image.base64
+            }
+            
+            headers = {
+                "Content-Type": "application/json"
+            }
+            
+            response = http_client.post(api_url, params=params, headers=headers, json=body)
         result = response.json()
     except requests.RequestException as e:
         print(f"API connection error: {str(e)}")
@@ -52,23 +126,36 @@ def detect_clothing_from_file(base64_image, api_url="http://localhost:6000/detec
         return []
     
     cropped_items = []
-    padding = 5
     
     # Check if 'detections' key exists in the response
     if 'detections' not in result:
         print(f"API Error: 'detections' not found in response. Full response: {result}")
         return []
+
+    if params is not None:
+        # Boxes are already padded and the crops already cut by the service
+        for item in result['detections']:
+            crop = item['image']
+            if crop_format == "array":
+                crop = np.asarray(images.ImagePayload.from_base64(crop).image)
+            cropped_items.append({
+                'box': item['box'],
+                'image': crop,
+                'confidence': item['confidence']
+            })
+        return cropped_items
         
+    boxes = []
     for item in result['detections']:
-        # Scale bounding box back to original image dimensions
         box = item['box']
         x1, y1, x2, y2 = [int(coord) for coord in box]
         
-        # Scale coordinates back to original image size
-        x1 = int(x1 * original_width / target_size[0])
-        y1 = int(y1 * original_height / target_size[1])
-        x2 = int(x2 * original_width / target_size[0])
-        y2 = int(y2 * original_height / target_size[1])
+        # Scale coordinates back to original image size (no-op unless the
+        # client resized the image itself)
+        x1 = int(x1 * scale_x)
+        y1 = int(y1 * scale_y)
+        x2 = int(x2 * scale_x)
+        y2 = int(y2 * scale_y)
         
         # Apply padding
         x1 = max(0, x1 - padding)
@@ -76,17 +163,23 @@ def detect_clothing_from_file(base64_image, api_url="http://localhost:6000/detec
         x2 = min(original_width, x2 + padding)
         y2 = min(original_height, y2 + padding)
         
-        # Crop from original image for better quality
-        cropped = img.crop((x1, y1, x2, y2))
-        
-        buffered = BytesIO()
-        cropped.save(buffered, format="JPEG")
-        cropped_encoded = base64.b64encode(buffered.getvalue()).decode("utf-8")
-        
+        boxes.append(([x1, y1, x2, y2], item['confidence']))
+
+    if not boxes:
+        return cropped_items
+
+    # Crop from original image for better quality
+    img = payload.image
+    if parallel_crops and len(boxes) > 1:
+        crops = list(_crop_executor.map(lambda b: _extract_crop(img, tuple(b[0]), crop_format), boxes))
+    else:
+        crops = [_extract_crop(img, tuple(box), crop_format) for box, _ in boxes]
+
+    for (box, confidence), crop in zip(boxes, crops):
         cropped_items.append({
-            'box': [x1, y1, x2, y2],  # Use scaled coordinates
-            'image': cropped_encoded,
-            'confidence': item['confidence']
+            'box': box,
+            'image': crop,
+            'confidence': confidence
         })
         
     return cropped_items
\ No newline at end of file
@@ -1,13 +1,48 @@
-import requests
+import os
+import time
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+import http_client
+import result_cache
 import base64
 from PIL import Image
 from io import BytesIO
 
-endpoint = "http://newmarqo.runai-modeltest.inferencing.shakticloud.ai"
+endpoint = os.getenv("EMBEDDING_ENDPOINT", "http://newmarqo.runai-modeltest.inferencing.shakticloud.ai")
+
+# Largest number of image/text pairs sent in one request
+MAX_BATCH_SIZE = int(os.getenv("EMBEDDING_MAX_BATCH_SIZE", "16"))
+
+# Send a list of images per request. Off unless the endpoint is known to accept
+# "image": [...]; without it every pair is its own request, as get_embeddings does.
+BATCH_IMAGES = os.getenv("EMBEDDING_BATCH_IMAGES", "") in ("1", "true", "yes")
+
+# Set when the endpoint rejects a list of images; later batches go pair by pair
+_batch_rejected = False
+
+# Part of the cache key; bump when the embedding model behind the endpoint changes
+MODEL_VERSION = os.getenv("EMBEDDING_MODEL_VERSION", endpoint)
+
+
+def _cache_key(image_b64, text_description):
+    return result_cache.content_key(image_b64, MODEL_VERSION, text_description)
 
 
 def get_embeddings(image_b64, text_description):
 
+    cache = result_cache.get_cache()
+    if cache is not None:
+        cached = cache.get_embeddings(_cache_key(image_b64, text_description))
+        if cached is not None:
+            return cached
+    return _post_single(image_b64, text_description)
+
+
+def _post_single(image_b64, text_description):
+
+    cache = result_cache.get_cache()
+
     try:
         
         payload = {
@@ -16,10 +51,13 @@ def get_embeddings(image_b64, text_description):
         }
         
 
-        response = requests.post(endpoint, json=payload)
+        response = http_client.post(endpoint, json=payload)
         
         if response.ok:
             data = response.json()
+            if cache is not None:
+                cache.put_embeddings(_cache_key(image_b64, text_description),
+                                     data["image_features"], data["text_features"][0])
             return data["image_features"], data["text_features"][0]
         else:
             print(f"Error: {response.status_code} - {response.text}")
@@ -27,4 +65,181 @@ def get_embeddings(image_b64, text_description):
             
     except Exception as e:
         print(f"Error getting embeddings: {str(e)}")
-        return None, None
\ No newline at end of file
+        return None, None
+
+
+def get_embeddings_batch(images, texts, max_batch_size=MAX_BATCH_SIZE):
+    """
+    Embed many image/text pairs, packing up to max_batch_size pairs per request.
+
+    Returns a list of (image_embedding, text_embedding) tuples in input order;
+    pairs from a failed request come back as (None, None).
+    """
+    if len(images) != len(texts):
+        raise ValueError("images and texts must have the same length")
+
+    cache = result_cache.get_cache()
+    if cache is None:
+        return _embed_uncached(images, texts, max_batch_size)
+
+    results = [cache.get_embeddings(_cache_key(image, text)) for image, text in zip(images, texts)]
+    missing = [i for i, result in enumerate(results) if result is None]
+    if missing:
+        fetched = _embed_uncached(
+            [images[i] for i in missing],
+            [texts[i] for i in missing],
+            max_batch_size
+        )
+        for i, result in zip(missing, fetched):
+            results[i] = result
+    return results
+
+
+def _embed_uncached(images, texts, max_batch_size, batch_images=BATCH_IMAGES):
+    if not batch_images or _batch_rejected:
+        return [_post_single(image, text) for image, text in zip(images, texts)]
+    results = []
+    for start in range(0, len(images), max_batch_size):
+        chunk_images = images[start:start + max_batch_size]
+        chunk_texts = texts[start:start + max_batch_size]
+        results.extend(_post_batch(chunk_images, chunk_texts))
+    return results
+
+
+def _reject_batching(reason):
+    global _batch_rejected
+    if not _batch_rejected:
+        print(f"Embedding endpoint does not support image batches ({reason}); sending pairs one by one")
+    _batch_rejected = True
+
+
+def _post_batch(images, texts):
+    if len(images) == 1 or _batch_rejected:
+        return [_post_single(image, text) for image, text in zip(images, texts)]
+
+    cache = result_cache.get_cache()
+
+    try:
+        # Same payload as get_embeddings, with a list of images instead of one
+        payload = {
+            "image": list(images),
+            "text": list(texts)
+        }
+
+        response = http_client.post(endpoint, json=payload)
+
+        if 400 <= response.status_code < 500:
+            _reject_batching(f"{response.status_code} - {response.text}")
+            return [_post_single(image, text) for image, text in zip(images, texts)]
+        if response.ok:
+            data = response.json()
+            image_features = data["image_features"]
+            text_features = data["text_features"]
+            # A single image vector back (a list of floats) means the list was not understood
+            if (len(image_features) != len(images) or len(text_features) != len(texts)
+                    or not all(isinstance(emb, list) for emb in image_features)):
+                _reject_batching(
+                    f"expected {len(images)} embeddings, got {len(image_features)} image "
+                    f"and {len(text_features)} text values"
+                )
+                return [_post_single(image, text) for image, text in zip(images, texts)]
+            if cache is not None:
+                for image, text, image_emb, text_emb in zip(images, texts, image_features, text_features):
+                    cache.put_embeddings(_cache_key(image, text), image_emb, text_emb)
+            return list(zip(image_features, text_features))
+        else:
+            print(f"Error: {response.status_code} - {response.text}")
+
+    except Exception as e:
+        print(f"Error getting batch embeddings: {str(e)}")
+    return [(None, None)] * len(images)
+
+
+class EmbeddingBatcher:
+    """
+    Micro-batcher for concurrent get_embeddings callers.
+
+    submit() queues a single image/text pair and returns a Future resolving to
+    (image_embedding, text_embedding). A dispatcher thread groups pairs that
+    arrive within max_wait_ms of each other (up to max_batch_size) into one
+    get_embeddings_batch request; up to max_in_flight requests run at once.
+
+    With batch_images off (EMBEDDING_BATCH_IMAGES unset) embed() calls
+    get_embeddings in the caller's thread and nothing is queued.
+    """
+
+    def __init__(self, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=10, max_in_flight=4, batch_images=BATCH_IMAGES):
+        self.max_batch_size = max_batch_size
+        self.batch_images = batch_images
+        self.max_wait = max_wait_ms / 1000
+        self.batches_sent = 0
+        self.items_sent = 0
+        self._queue = queue.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="embed-batch")
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, daemon=True)
+        self._dispatcher.start()
+
+    def submit(self, image_b64, text_description):
+        future = Future()
+        # Cache hits resolve immediately instead of waiting for a batch window
+        cache = result_cache.get_cache()
+        cached = cache.get_embeddings(_cache_key(image_b64, text_description)) if cache is not None else None
+        if cached is not None:
+            future.set_result(cached)
+        else:
+            self._queue.put((image_b64, text_description, future))
+        return future
+
+    def embed(self, image_b64, text_description):
+        """Blocking drop-in for get_embeddings that goes through the batcher."""
+        if not self.batch_images or _batch_rejected:
+            return get_embeddings(image_b64, text_description)
+        return self.submit(image_b64, text_description).result()
+
+    def _dispatch_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self.batches_sent += 1
+            self.items_sent += len(batch)
+            self._executor.submit(self._run_batch, batch)
+
+    def _run_batch(self, batch):
+        try:
+            results = _embed_uncached(
+                [image for image, _, _ in batch],
+                [text for _, text, _ in batch],
+                self.max_batch_size,
+                self.batch_images
+            )
+        except Exception as e:
+            print(f"Error getting batch embeddings: {str(e)}")
+            results = [(None, None)] * len(batch)
+        for (_, _, future), result in zip(batch, results):
+            future.set_result(result)
+
+    @property
+    def average_batch_size(self):
+        return self.items_sent / self.batches_sent if self.batches_sent else 0.0
+
+
+_default_batcher = None
+_default_batcher_lock = threading.Lock()
+
+
+def get_batcher():
+    """Process-wide EmbeddingBatcher shared by all worker threads."""
+    global _default_batcher
+    if _default_batcher is None:
+        with _default_batcher_lock:
+            if _default_batcher is None:
+                _default_batcher = EmbeddingBatcher()
+    return _default_batcher
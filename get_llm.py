@@ -1,9 +1,14 @@
 import os
 import requests
+import http_client
+import result_cache
 import json 
 import re
 from typing import Optional, List, Dict, Any, Union
 
+# Vision calls regularly take longer than the default HTTP read timeout
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "120"))
+
 prompt = """You are a fashion image-understanding model.
 
 You will receive an image of a model wearing multiple clothing items along with optional accompanying text. However, only one clothing item (either top or bottom) is being marketed or sold.
@@ -61,12 +66,24 @@ def query_litellm(
     description: str,
     image_base64: Optional[str] = None,
     model: str = "claude-3-7-sonnet", 
+    image_mime_type: str = "image/jpeg",
     api_key: Optional[str] = None,
     api_base: Optional[str] = None
 ) -> str:
 
-    api_base = "https://api.rabbithole.cred.club"
-    api_key = ""
+    api_base = api_base or os.getenv("LITELLM_API_BASE", "https://api.rabbithole.cred.club")
+    api_key = api_key or os.getenv("LITELLM_API_KEY", "")
+
+    prompt_text = prompt.format(text=text, description=description)
+
+    # Same image, model and prompt always produce the same description, so
+    # serve repeats from the local cache instead of the gateway
+    cache = result_cache.get_cache() if image_base64 else None
+    if cache is not None:
+        cache_key = result_cache.content_key(image_base64, model, prompt_text)
+        cached = cache.get_llm(cache_key)
+        if cached is not None:
+            return cached
     
     if not api_key:
         raise ValueError("API key is required. Provide it as a parameter or set LITELLM_API_KEY environment variable.")
@@ -82,12 +99,12 @@ def query_litellm(
     content = [
         {
             "type": "text",
-            "text": prompt.format(text=text, description=description)
+            "text": prompt_text
         },
         {
             "type": "image_url",
             "image_url": {
-                "url": "data:image/jpeg;base64," + image_base64
+                "url": f"data:{image_mime_type};base64," + image_base64
             },
         },
     ]
@@ -103,7 +120,7 @@ def query_litellm(
     }
 
     try:
-        response = requests.post(endpoint, headers=headers, json=payload)
+        response = http_client.post(endpoint, headers=headers, json=payload, timeout=LLM_TIMEOUT)
         response.raise_for_status()  
         result = response.json()
 
@@ -111,7 +128,10 @@ def query_litellm(
         if "choices" in result and len(result["choices"]) > 0:
             message = result["choices"][0]["message"]
             if "content" in message:
-                return jsonify(message["content"])
+                parsed = jsonify(message["content"])
+                if cache is not None and isinstance(parsed, dict):
+                    cache.put_llm(cache_key, parsed)
+                return parsed
         return result
     
     except requests.exceptions.RequestException as e:
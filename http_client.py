@@ -0,0 +1,95 @@
+import os
+import random
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Defaults can be overridden with environment variables or configure()
+_settings = {
+    "pool_size": int(os.getenv("HTTP_POOL_SIZE", "32")),
+    "connect_timeout": float(os.getenv("HTTP_CONNECT_TIMEOUT", "5")),
+    "read_timeout": float(os.getenv("HTTP_READ_TIMEOUT", "60")),
+    "max_retries": int(os.getenv("HTTP_MAX_RETRIES", "3")),
+    "backoff_factor": float(os.getenv("HTTP_BACKOFF_FACTOR", "0.5")),
+}
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class JitteredRetry(Retry):
+    """Exponential backoff with random jitter so parallel workers don't retry in lockstep."""
+
+    def get_backoff_time(self):
+        backoff = super().get_backoff_time()
+        return random.uniform(0, backoff) + backoff / 2 if backoff else 0
+
+
+def configure(**overrides):
+    """
+    Change pool/timeout/retry settings, e.g. configure(pool_size=num_workers).
+
+    The shared session is rebuilt lazily on the next request.
+    """
+    global _session
+    unknown = set(overrides) - set(_settings)
+    if unknown:
+        raise ValueError(f"Unknown HTTP client settings: {', '.join(sorted(unknown))}")
+    with _session_lock:
+        _settings.update(overrides)
+        old_session, _session = _session, None
+    if old_session is not None:
+        old_session.close()
+
+
+def get_session():
+    """Return the process-wide keep-alive Session, creating it on first use."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+
+def _build_session():
+    retry = JitteredRetry(
+        total=_settings["max_retries"],
+        connect=_settings["max_retries"],
+        # A read error means the request reached the server; don't pay for the
+        # LLM call twice
+        read=0,
+        status=_settings["max_retries"],
+        status_forcelist=RETRY_STATUS_CODES,
+        allowed_methods=None,  # retry POST too, our endpoints are idempotent
+        backoff_factor=_settings["backoff_factor"],
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=_settings["pool_size"],
+        pool_maxsize=_settings["pool_size"],
+        max_retries=retry,
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def request(method, url, timeout=None, **kwargs):
+    """Send a request through the shared session with the default timeouts."""
+    if timeout is None:
+        timeout = (_settings["connect_timeout"], _settings["read_timeout"])
+    return get_session().request(method, url, timeout=timeout, **kwargs)
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
@@ -0,0 +1,91 @@
+import base64
+from io import BytesIO
+from PIL import Image
+import http_client
+
+# Formats the LLM gateway, embedding endpoint and detection service all accept
+# as-is; anything else is transcoded to JPEG once at fetch time
+PASSTHROUGH_FORMATS = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp", "GIF": "image/gif"}
+
+
+class ImagePayload:
+    """
+    An image as its original compressed bytes.
+
+    The decoded PIL image and the base64 form are computed on first use and
+    cached, so each stage can ask for what it needs without decoding or
+    encoding the same image twice.
+    """
+
+    def __init__(self, data, mime_type="image/jpeg"):
+        self.data = data
+        self.mime_type = mime_type
+        self._image = None
+        self._base64 = None
+
+    @classmethod
+    def from_base64(cls, image_b64):
+        if image_b64.startswith("data:"):
+            header, image_b64 = image_b64.split(",", 1)
+            mime_type = header[len("data:"):].split(";")[0] or "image/jpeg"
+        else:
+            mime_type = "image/jpeg"
+        payload = cls(base64.b64decode(image_b64), mime_type)
+        payload._base64 = image_b64
+        return payload
+
+    @classmethod
+    def from_image(cls, image, format="JPEG", quality=75):
+        """Encode a PIL image; used when the pixels really did change (crops, resizes)."""
+        buffered = BytesIO()
+        image.save(buffered, format=format, quality=quality)
+        payload = cls(buffered.getvalue(), PASSTHROUGH_FORMATS.get(format, "image/jpeg"))
+        payload._image = image
+        return payload
+
+    @property
+    def image(self):
+        """Decoded RGB PIL image (decoded once)."""
+        if self._image is None:
+            self._image = Image.open(BytesIO(self.data)).convert("RGB")
+        return self._image
+
+    @property
+    def size(self):
+        return self.image.size
+
+    @property
+    def base64(self):
+        """Base64 of the original bytes, for JSON request bodies."""
+        if self._base64 is None:
+            self._base64 = base64.b64encode(self.data).decode("utf-8")
+        return self._base64
+
+    @property
+    def data_url(self):
+        return f"data:{self.mime_type};base64,{self.base64}"
+
+
+def as_image_payload(image):
+    """Accept an ImagePayload or a base64 string (the older calling convention)."""
+    if isinstance(image, ImagePayload):
+        return image
+    return ImagePayload.from_base64(image)
+
+
+def fetch_image(image_url, timeout=10):
+    """Download an image, keeping the original bytes unless the format needs converting."""
+    try:
+        response = http_client.get(image_url, timeout=timeout)
+    except Exception as e:
+        raise Exception(f"Request error for URL {image_url}: {str(e)}")
+    if response.status_code != 200:
+        raise Exception(f"Failed to fetch image from URL: {image_url}")
+
+    data = response.content
+    # Image.open only parses the header here, the pixels are not decoded
+    header = Image.open(BytesIO(data))
+    mime_type = PASSTHROUGH_FORMATS.get(header.format)
+    if mime_type is not None:
+        return ImagePayload(data, mime_type)
+    return ImagePayload.from_image(header.convert("RGB"), format="JPEG", quality=95)
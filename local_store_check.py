@@ -0,0 +1,67 @@
+"""
+Reopen check for the embedded vector store (milvus.local):
+
+    python local_store_check.py
+
+Creates a store with random-projection reducers, inserts rows, then reopens
+it without reducers and with differently fitted ones; both must be refused,
+by LocalDualClient and by MilvusDualSearch. Reopening with the original
+reducers must find every row still in place.
+"""
+import shutil
+import tempfile
+import numpy as np
+from milvus.local import LocalDualClient
+from milvus.fetch import MilvusDualSearch
+from milvus.reduce import VectorReducer
+
+
+def expect_refused(open_store, description):
+    try:
+        open_store()
+    except ValueError as e:
+        print(f"Refused as expected: {str(e)}")
+    else:
+        raise AssertionError(f"Opened a reduced store {description}")
+
+
+def check_reopen(path):
+    rng = np.random.default_rng(0)
+    sample = rng.normal(size=(300, 768))
+    reducers = {name: VectorReducer.fit(sample, 64, "random") for name in ("text_embedding", "image_embedding")}
+    other = {name: VectorReducer.fit(sample, 64, "random", seed=1) for name in reducers}
+    rows = [
+        {
+            "product_id": f"check{i}",
+            "category": "top",
+            "metadata": {"title": f"Product {i}"},
+            "text_embedding": rng.normal(size=768).tolist(),
+            "image_embedding": rng.normal(size=768).tolist(),
+        }
+        for i in range(100)
+    ]
+
+    client = LocalDualClient(path, reducers=reducers)
+    client.insert_entities(rows)
+    client.close()
+    for wrong, description in (({}, "without reducers"), (other, "with other reducers")):
+        expect_refused(lambda: LocalDualClient(path, reducers=wrong), description)
+
+    client = LocalDualClient(path, reducers=reducers)
+    for wrong, description in (({}, "for search without reducers"), (other, "for search with other reducers")):
+        expect_refused(
+            lambda: MilvusDualSearch(client.text_collection, client.image_collection, reducers=wrong),
+            description
+        )
+    for collection in (client.text_collection, client.image_collection):
+        if collection.num_entities != len(rows):
+            raise AssertionError(f"{collection.name} has {collection.num_entities} rows after reopening, not {len(rows)}")
+    print(f"Reopened with {len(rows)} rows per collection intact.")
+
+
+if __name__ == "__main__":
+    directory = tempfile.mkdtemp(prefix="local_store_check_")
+    try:
+        check_reopen(directory)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
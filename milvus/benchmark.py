@@ -0,0 +1,259 @@
+# benchmark.py
+"""
+Measure recall and latency of vector index settings on real embeddings.
+
+    python -m milvus.benchmark --collection fashion_items_image --field image_embedding \
+        --sample 50000 --queries 500 --index-types HNSW,IVF_FLAT,IVF_PQ,DISKANN
+
+A sample of stored vectors is split into a base set and held-out queries,
+and exact top-k neighbours are computed with NumPy. Every index config of
+the sweep is then built on the base set in a scratch collection and
+searched with each of its search parameters; the report has recall@k,
+p50/p99 latency, QPS (one query at a time, like MilvusDualSearch does per
+crop), build time and loaded memory. "LOCAL" benchmarks the embedded
+brute-force store (milvus.local) as a baseline.
+
+The fastest config that reaches --target-recall is printed as the
+MILVUS_INDEX_TYPE / MILVUS_INDEX_PARAMS / MILVUS_SEARCH_PARAMS settings read
+by MilvusDualClient and MilvusDualSearch.
+"""
+import json
+import math
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+from pymilvus import connections, utility, Collection, CollectionSchema, FieldSchema, DataType
+
+INDEX_TYPES = ("HNSW", "IVF_FLAT", "IVF_SQ8", "IVF_PQ", "DISKANN", "LOCAL")
+
+
+def default_sweep(base_count, dim, limit):
+    """(index_type, build params, [search params]) for every config to try."""
+    nlist = max(16, min(65536, int(4 * math.sqrt(base_count))))
+    nprobes = [n for n in (8, 16, 32, 64, 128) if n <= nlist]
+    # HNSW and DiskANN need a candidate list at least as long as the limit
+    efs = sorted({max(limit, ef) for ef in (64, 128, 250, 500, 1000)})
+    pq_m = next(m for m in (48, 32, 24, 16, 8, 4, 2, 1) if dim % m == 0)
+    return [
+        ("HNSW", {"M": 8, "efConstruction": 64}, [{"ef": ef} for ef in efs]),
+        ("HNSW", {"M": 16, "efConstruction": 200}, [{"ef": ef} for ef in efs]),
+        ("HNSW", {"M": 32, "efConstruction": 400}, [{"ef": ef} for ef in efs]),
+        ("IVF_FLAT", {"nlist": nlist}, [{"nprobe": n} for n in nprobes]),
+        ("IVF_SQ8", {"nlist": nlist}, [{"nprobe": n} for n in nprobes]),
+        ("IVF_PQ", {"nlist": nlist, "m": pq_m, "nbits": 8}, [{"nprobe": n} for n in nprobes]),
+        ("DISKANN", {}, [{"search_list": ef} for ef in efs]),
+        ("LOCAL", {}, [{}]),
+    ]
+
+
+def sample_vectors(collection_name, field, count, batch_size=1000):
+    """Read up to count vectors of field from an existing collection."""
+    collection = Collection(collection_name)
+    collection.load()
+    iterator = collection.query_iterator(
+        batch_size=batch_size,
+        expr='product_id != ""',
+        output_fields=[field]
+    )
+    vectors = []
+    while len(vectors) < count:
+        page = iterator.next()
+        if not page:
+            break
+        vectors.extend(row[field] for row in page)
+    iterator.close()
+    return np.asarray(vectors[:count], dtype=np.float32)
+
+
+def normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1)
+
+
+def exact_neighbours(base, queries, k, chunk_size=256):
+    """Exact cosine top-k row numbers of base for every query."""
+    base = normalize(base)
+    queries = normalize(queries)
+    neighbours = np.empty((len(queries), k), dtype=np.int64)
+    for start in range(0, len(queries), chunk_size):
+        scores = queries[start:start + chunk_size] @ base.T
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+        neighbours[start:start + chunk_size] = np.take_along_axis(top, order, axis=1)
+    return neighbours
+
+
+def _schema(dim):
+    return CollectionSchema(fields=[
+        FieldSchema(name="row", dtype=DataType.INT64, is_primary=True, auto_id=False),
+        FieldSchema(name="vector", dtype=DataType.FLOAT_VECTOR, dim=dim),
+    ], description="Index benchmark scratch collection")
+
+
+def build_collection(index_type, build_params, base, batch_size=2000):
+    """Create, fill, index and load a scratch collection; returns (collection, build seconds, memory bytes, cleanup)."""
+    rows = list(range(len(base)))
+    if index_type == "LOCAL":
+        from milvus.local import LocalCollection
+        directory = tempfile.mkdtemp(prefix="index_benchmark_")
+        collection = LocalCollection(directory, _schema(base.shape[1]))
+        started = time.perf_counter()
+        for start in range(0, len(base), batch_size):
+            collection.insert([rows[start:start + batch_size], base[start:start + batch_size]])
+        collection.flush()
+        build_seconds = time.perf_counter() - started
+        return collection, build_seconds, base.shape[0] * base.shape[1] * 4, lambda: shutil.rmtree(directory)
+
+    name = f"index_benchmark_{index_type.lower()}"
+    if utility.has_collection(name):
+        utility.drop_collection(name)
+    collection = Collection(name=name, schema=_schema(base.shape[1]))
+    for start in range(0, len(base), batch_size):
+        collection.insert([rows[start:start + batch_size], base[start:start + batch_size].tolist()])
+    collection.flush()
+
+    started = time.perf_counter()
+    collection.create_index(field_name="vector", index_params={
+        "metric_type": "COSINE",
+        "index_type": index_type,
+        "params": build_params
+    })
+    utility.wait_for_index_building_complete(name)
+    collection.load()
+    build_seconds = time.perf_counter() - started
+
+    try:
+        memory = sum(segment.mem_size for segment in utility.get_query_segment_info(name))
+    except Exception as e:
+        print(f"Could not read segment memory for {name}: {str(e)}")
+        memory = None
+
+    def cleanup():
+        collection.release()
+        utility.drop_collection(name)
+    return collection, build_seconds, memory, cleanup
+
+
+def measure(collection, queries, truth, k, limit, search_params):
+    """Search every query on its own; returns recall@k and latency stats."""
+    latencies = []
+    found = 0
+    for query, expected in zip(queries, truth):
+        started = time.perf_counter()
+        hits = collection.search(
+            data=[query.tolist()],
+            anns_field="vector",
+            param={"metric_type": "COSINE", "params": search_params},
+            limit=limit,
+            output_fields=["row"]
+        )[0]
+        latencies.append(time.perf_counter() - started)
+        returned = {hit.id for hit in list(hits)[:k]}
+        found += len(returned & set(expected.tolist()))
+
+    latencies = np.asarray(latencies)
+    return {
+        "recall": found / (len(queries) * k),
+        "p50_ms": float(np.percentile(latencies, 50) * 1000),
+        "p99_ms": float(np.percentile(latencies, 99) * 1000),
+        "qps": len(queries) / float(latencies.sum()),
+    }
+
+
+def run(sweep, base, queries, k, limit):
+    truth = exact_neighbours(base, queries, k)
+    results = []
+    for index_type, build_params, search_param_sets in sweep:
+        print(f"Building {index_type} {json.dumps(build_params)} on {len(base)} vectors...")
+        try:
+            collection, build_seconds, memory, cleanup = build_collection(index_type, build_params, base)
+        except Exception as e:
+            # e.g. DiskANN on a deployment without local disk configured
+            print(f"Skipping {index_type}: {str(e)}")
+            continue
+        try:
+            for search_params in search_param_sets:
+                result = {
+                    "index_type": index_type,
+                    "build_params": build_params,
+                    "search_params": search_params,
+                    "build_seconds": build_seconds,
+                    "memory_bytes": memory,
+                }
+                result.update(measure(collection, queries, truth, k, limit, search_params))
+                results.append(result)
+                print(format_result(result, k))
+        finally:
+            cleanup()
+    return results
+
+
+def format_result(result, k):
+    memory = f"{result['memory_bytes'] / 1024 / 1024:.0f}MB" if result["memory_bytes"] is not None else "?"
+    return (f"{result['index_type']:<9} build={json.dumps(result['build_params'])} "
+            f"search={json.dumps(result['search_params'])}  recall@{k}={result['recall']:.4f}  "
+            f"p50={result['p50_ms']:.2f}ms  p99={result['p99_ms']:.2f}ms  qps={result['qps']:.0f}  "
+            f"build={result['build_seconds']:.1f}s  mem={memory}")
+
+
+def recommend(results, target_recall):
+    """Lowest p99 latency among the (Milvus) configs reaching target_recall."""
+    candidates = [r for r in results if r["recall"] >= target_recall and r["index_type"] != "LOCAL"]
+    if not candidates:
+        return None
+    return min(candidates, key=lambda r: r["p99_ms"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recall/latency benchmark of Milvus index settings")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", default="19530")
+    parser.add_argument("--collection", default="fashion_items_image", help="Collection to sample vectors from")
+    parser.add_argument("--field", default="image_embedding", help="Vector field to sample")
+    parser.add_argument("--sample", type=int, default=50000, help="Vectors to read (base set plus queries)")
+    parser.add_argument("--queries", type=int, default=500, help="Held-out query vectors")
+    parser.add_argument("--top-k", type=int, default=10, help="k for recall@k")
+    parser.add_argument("--limit", type=int, default=200,
+                        help="Search limit, as used by MilvusDualSearch (max(top_k * 20, 200))")
+    parser.add_argument("--index-types", default=",".join(INDEX_TYPES),
+                        help="Comma-separated index types to include from the default sweep")
+    parser.add_argument("--sweep", help="JSON file with [index_type, build_params, [search_params, ...]] entries")
+    parser.add_argument("--target-recall", type=float, default=0.95)
+    parser.add_argument("--output", help="Write all results to this JSON file")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    connections.connect("default", host=args.host, port=args.port)
+    vectors = sample_vectors(args.collection, args.field, args.sample)
+    if len(vectors) <= args.queries:
+        raise SystemExit(f"Only {len(vectors)} vectors in {args.collection}; need more than --queries")
+    order = np.random.default_rng(args.seed).permutation(len(vectors))
+    queries = vectors[order[:args.queries]]
+    base = vectors[order[args.queries:]]
+
+    if args.sweep:
+        with open(args.sweep, "r") as f:
+            sweep = json.load(f)
+    else:
+        wanted = {name.strip().upper() for name in args.index_types.split(",")}
+        sweep = [entry for entry in default_sweep(len(base), base.shape[1], args.limit) if entry[0] in wanted]
+
+    results = run(sweep, base, queries, args.top_k, args.limit)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Wrote {len(results)} results to {args.output}")
+
+    best = recommend(results, args.target_recall)
+    if best is None:
+        print(f"No config reached recall@{args.top_k} >= {args.target_recall}.")
+    else:
+        print(f"\nFastest config with recall@{args.top_k} >= {args.target_recall}:")
+        print(format_result(best, args.top_k))
+        print(f"MILVUS_INDEX_TYPE={best['index_type']}")
+        print(f"MILVUS_INDEX_PARAMS='{json.dumps(best['build_params'])}'")
+        print(f"MILVUS_SEARCH_PARAMS='{json.dumps(best['search_params'])}'")
+        print("Index settings apply to newly created collections.")
@@ -1,7 +1,94 @@
 # fetch_dual.py
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
+import grpc
 from pymilvus import Collection
-from typing import List, Dict, Any, Union, Optional
+from pymilvus.exceptions import (
+    MilvusException,
+    MilvusUnavailableException,
+    ConnectError,
+    ConnectionNotExistException,
+)
+from typing import List, Dict, Any, Union, Optional, Callable, Tuple
+from milvus.store import (
+    has_promoted_fields,
+    write_generation,
+    default_search_params,
+    built_index_type,
+    vector_fields,
+    check_reducers,
+    encode_vectors,
+)
+from milvus.reduce import load_reducers
+from milvus.query_cache import QueryResultCache, CACHE_SIZE
+
+# Structured search filters: exact-match string fields and numeric ranges
+STRING_FILTERS = ("brand", "source")
+RANGE_FILTERS = {
+    "min_price": ("price", ">="),
+    "max_price": ("price", "<="),
+    "min_discounted_price": ("discounted_price", ">="),
+    "max_discounted_price": ("discounted_price", "<="),
+}
+
+# Failures worth a reconnect. Other MilvusExceptions (ParamError, a rejected
+# filter expression, a dimension mismatch) are the caller's and propagate
+CONNECTION_ERRORS = (
+    MilvusUnavailableException, ConnectError, ConnectionNotExistException, ConnectionError, TimeoutError
+)
+RETRYABLE_GRPC_CODES = (grpc.StatusCode.UNAVAILABLE, grpc.StatusCode.DEADLINE_EXCEEDED)
+# Server error code for a search on a released collection; reloading fixes it
+COLLECTION_NOT_LOADED = 101
+
+
+def is_connection_error(error: BaseException) -> bool:
+    if isinstance(error, CONNECTION_ERRORS):
+        return True
+    if isinstance(error, grpc.RpcError):
+        return error.code() in RETRYABLE_GRPC_CODES
+    return isinstance(error, MilvusException) and error.code == COLLECTION_NOT_LOADED
+
+
+def build_filter_expr(
+    category: Optional[str] = None,
+    filters: Optional[Dict[str, Any]] = None,
+    promoted_fields: bool = True
+) -> Optional[str]:
+    """
+    Turn a category and structured filters into a Milvus boolean expression.
+
+    filters may contain brand and source (a value or a list of values) and
+    min_/max_price, min_/max_discounted_price. With promoted_fields the
+    conditions use the typed scalar fields, and products without a price are
+    excluded from price ranges; otherwise they fall back to (slower) JSON path
+    lookups into metadata.
+    """
+    conditions = []
+    if category:
+        conditions.append(f"category == {json.dumps(category)}")
+
+    for key, value in (filters or {}).items():
+        if value is None:
+            continue
+        if key in STRING_FILTERS:
+            field = key if promoted_fields else f'metadata["{key}"]'
+            if isinstance(value, (list, tuple, set)):
+                conditions.append(f"{field} in {json.dumps(list(value))}")
+            else:
+                conditions.append(f"{field} == {json.dumps(value)}")
+        elif key in RANGE_FILTERS:
+            name, operator = RANGE_FILTERS[key]
+            field = name if promoted_fields else f'metadata["{name}"]'
+            conditions.append(f"{field} {operator} {float(value)}")
+            if promoted_fields and operator == "<=":
+                conditions.append(f"{field} >= 0")
+        else:
+            raise ValueError(f"Unknown search filter: {key}")
+
+    return " and ".join(dict.fromkeys(conditions)) if conditions else None
+
 
 class MilvusDualSearch:
     def __init__(
@@ -9,7 +96,11 @@ class MilvusDualSearch:
         text_collection: Collection,
         image_collection: Collection,
         text_weight: float = 0.5,
-        image_weight: float = 0.5
+        image_weight: float = 0.5,
+        reconnect: Optional[Callable[[], Tuple[Collection, Collection]]] = None,
+        cache: Optional[QueryResultCache] = None,
+        search_params: Optional[Dict[str, Any]] = None,
+        reducers: Optional[Dict[str, Any]] = None
     ):
         """
         Initialize the dual search client with separate collections.
@@ -17,13 +108,85 @@ class MilvusDualSearch:
         Args:
             text_collection: Milvus Collection object storing text embeddings.
             image_collection: Milvus Collection object storing image embeddings.
+                May be the same collection as text_collection (unified layout).
             text_weight: Weight for text similarity.
             image_weight: Weight for image similarity.
+            reconnect: Optional callable returning fresh (text, image)
+                collections; used to recover after a failed search.
+            cache: Result cache for repeated queries. Defaults to a new
+                QueryResultCache sized by SEARCH_CACHE_SIZE (0 disables it).
+            search_params: Index search parameters (e.g. {"ef": 250} for
+                HNSW) for both fields; by default each field gets
+                milvus.store.default_search_params() for the index its
+                collection actually has.
+            reducers: Per-field VectorReducers applied to query vectors;
+                must match the ones the collections were created with
+                (default: loaded from MILVUS_REDUCER_PATH).
         """
         self.text_collection = text_collection
         self.image_collection = image_collection
         self.text_weight = text_weight
         self.image_weight = image_weight
+        self._reconnect = reconnect
+        # brand/source/price as typed fields (filterable schema) or only in metadata
+        self.promoted_fields = has_promoted_fields(text_collection)
+        self.reducers = reducers if reducers is not None else load_reducers()
+        self._search_params_override = search_params
+        self._read_vector_fields()
+        self._loaded = False
+        self._lock = threading.Lock()
+        # Bumped on every reconnect, so threads that failed on the same
+        # connection reconnect once between them
+        self._connection_generation = 0
+        # Runs the text and image ANN searches of fusion_search side by side
+        self._executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="milvus-search")
+        if cache is None and CACHE_SIZE > 0:
+            cache = QueryResultCache()
+        self.cache = cache
+
+    def ensure_loaded(self):
+        """Load both collections once; later calls are a flag check."""
+        if self._loaded:
+            return
+        with self._lock:
+            if not self._loaded:
+                self.text_collection.load()
+                self.image_collection.load()
+                self._loaded = True
+
+    def _recover(self, failed_generation):
+        """
+        Forget the load state and reconnect, so the next search starts clean.
+
+        Only the first thread to fail on a connection reconnects; the others
+        wait on the lock and then retry on the new connection.
+        """
+        with self._lock:
+            if self._connection_generation != failed_generation:
+                return
+            self._loaded = False
+            if self._reconnect is not None:
+                self.text_collection, self.image_collection = self._reconnect()
+                self.promoted_fields = has_promoted_fields(self.text_collection)
+                self._read_vector_fields()
+            self._connection_generation += 1
+
+    def _read_vector_fields(self):
+        # Query vectors must match the stored dimension and precision
+        self.vector_fields = {**vector_fields(self.text_collection), **vector_fields(self.image_collection)}
+        check_reducers(self.vector_fields, self.reducers, collections=(self.text_collection, self.image_collection))
+        # Per vector field, for the index each collection was built with
+        self.search_params = {
+            name: self._search_params_override if self._search_params_override is not None
+            else default_search_params(built_index_type(collection, name))
+            for name, collection in (("text_embedding", self.text_collection),
+                                     ("image_embedding", self.image_collection))
+        }
+
+    def _query_vectors(self, queries, indexes, name):
+        embeddings = np.vstack([self._prepare_embedding(queries[i][name]) for i in indexes])
+        data_type = self.vector_fields[name][0] if name in self.vector_fields else None
+        return encode_vectors(embeddings, data_type, self.reducers.get(name))
 
     def search(
         self,
@@ -32,65 +195,147 @@ class MilvusDualSearch:
         top_k: int = 10,
         text_threshold: float = 0.1,
         image_threshold: float = 0.1,
-        category: Optional[str] = None
+        category: Optional[str] = None,
+        filters: Optional[Dict[str, Any]] = None
     ) -> List[Dict[str, Any]]:
+        return self.search_batch(
+            [{
+                "text_embedding": text_embedding,
+                "image_embedding": image_embedding,
+                "category": category,
+                "filters": filters
+            }],
+            top_k=top_k,
+            text_threshold=text_threshold,
+            image_threshold=image_threshold
+        )[0]
+
+    def search_batch(
+        self,
+        queries: List[Dict[str, Any]],
+        top_k: int = 10,
+        text_threshold: float = 0.1,
+        image_threshold: float = 0.1
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Run several dual searches with one search RPC per collection and filter.
+
+        Args:
+            queries: Dicts with text_embedding, image_embedding and optional
+                category and filters keys (e.g. every crop of a pin, or of a
+                whole board). See build_filter_expr for the filters format.
+
+        Returns:
+            One result list per query, in order, as returned by search().
+            Queries seen recently (same quantized embeddings and parameters)
+            are answered from self.cache without touching Milvus.
+        """
         # Ensure minimum of 5 results
         top_k = max(top_k, 5)
-        
-        # Prepare embeddings as 2D arrays for search
-        text_embedding = self._prepare_embedding(text_embedding)
-        image_embedding = self._prepare_embedding(image_embedding)
-        
-        # Load both collections into memory
-        self.text_collection.load()
-        self.image_collection.load()
-        
-        search_params = {"metric_type": "COSINE", "params": {"ef": 250}}
-        expr = f'category == "{category}"' if category else None
-        output_fields = ["product_id", "category", "metadata"]
 
-        # Search text collection with higher limit to ensure enough matches
-        text_results = self.text_collection.search(
-            data=text_embedding,
-            anns_field="text_embedding",
-            param=search_params,
-            limit=max(top_k * 20, 200),  # Increased limit for more potential matches
-            expr=expr,
-            output_fields=output_fields
+        return self._cached_batch(
+            queries,
+            ("search", top_k, text_threshold, image_threshold, self.search_params),
+            lambda batch: self._with_retry(
+                self._search_batch, batch, self._group_by_filter(batch), top_k, text_threshold, image_threshold
+            )
         )
 
-        # Search image collection with higher limit
-        image_results = self.image_collection.search(
-            data=image_embedding,
-            anns_field="image_embedding",
-            param=search_params,
-            limit=max(top_k * 20, 200),  # Increased limit for more potential matches
-            expr=expr,
-            output_fields=output_fields
-        )
+    def _with_retry(self, search, *args):
+        generation = self._connection_generation
+        try:
+            return search(*args)
+        except Exception as e:
+            if not is_connection_error(e):
+                raise
+            # Connection dropped or collections released; retry once from scratch
+            print(f"Search failed, reconnecting to Milvus: {str(e)}")
+            self._recover(generation)
+            return search(*args)
+
+    def _cached_batch(self, queries, parts, run):
+        """Answer what the cache can, and run one batched search for the rest."""
+        if self.cache is None:
+            return run(queries)
+
+        # Read before searching, so a write that lands mid-search discards the result
+        generation = write_generation(self.text_collection.name, self.image_collection.name)
+        parts = parts + (self.text_weight, self.image_weight)
+        keys = [self.cache.key(query, *parts) for query in queries]
+        results = [self.cache.get(key, generation) for key in keys]
+
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            fresh = run([queries[i] for i in missing])
+            for i, result in zip(missing, fresh):
+                results[i] = result
+                self.cache.put(keys[i], result, generation)
+        return results
+
+    def cache_stats(self) -> Optional[Dict[str, Any]]:
+        """Hit rate and size of the query result cache (None when disabled)."""
+        return self.cache.stats() if self.cache is not None else None
+
+    def _search_batch(self, queries, groups, top_k, text_threshold, image_threshold):
+        self.ensure_loaded()
         
+        search_params = {
+            name: {"metric_type": "COSINE", "params": params} for name, params in self.search_params.items()
+        }
+        output_fields = ["product_id", "category", "metadata"]
+
+        results: List[List[Dict[str, Any]]] = [[] for _ in queries]
+        for expr, indexes in groups.items():
+            text_embeddings = self._query_vectors(queries, indexes, "text_embedding")
+            image_embeddings = self._query_vectors(queries, indexes, "image_embedding")
+
+            # Search text collection with higher limit to ensure enough matches
+            text_results = self.text_collection.search(
+                data=text_embeddings,
+                anns_field="text_embedding",
+                param=search_params["text_embedding"],
+                limit=max(top_k * 20, 200),  # Increased limit for more potential matches
+                expr=expr,
+                output_fields=output_fields
+            )
+
+            # Search image collection with higher limit
+            image_results = self.image_collection.search(
+                data=image_embeddings,
+                anns_field="image_embedding",
+                param=search_params["image_embedding"],
+                limit=max(top_k * 20, 200),  # Increased limit for more potential matches
+                expr=expr,
+                output_fields=output_fields
+            )
+
+            # Hits come back in the same order as the query vectors
+            for i, text_hits, image_hits in zip(indexes, text_results, image_results):
+                results[i] = self._combine_hits(text_hits, image_hits, top_k, text_threshold, image_threshold)
+        return results
+
+    def _combine_hits(self, text_hits, image_hits, top_k, text_threshold, image_threshold) -> List[Dict[str, Any]]:
+        """Join one query's text and image hits on product_id and rank them."""
         # Extract results from each search
         text_search_results = []
-        for hits in text_results:
-            for hit in hits:
-                if hit.score >= text_threshold:  # Apply threshold during extraction
-                    text_search_results.append({
-                        'product_id': hit.entity.product_id,
-                        'category': hit.entity.category,
-                        'metadata': hit.entity.metadata,
-                        'score': hit.score
-                    })
+        for hit in text_hits:
+            if hit.score >= text_threshold:  # Apply threshold during extraction
+                text_search_results.append({
+                    'product_id': hit.entity.product_id,
+                    'category': hit.entity.category,
+                    'metadata': hit.entity.metadata,
+                    'score': hit.score
+                })
 
         image_search_results = []
-        for hits in image_results:
-            for hit in hits:
-                if hit.score >= image_threshold:  # Apply threshold during extraction
-                    image_search_results.append({
-                        'product_id': hit.entity.product_id,
-                        'category': hit.entity.category,
-                        'metadata': hit.entity.metadata,
-                        'score': hit.score
-                    })
+        for hit in image_hits:
+            if hit.score >= image_threshold:  # Apply threshold during extraction
+                image_search_results.append({
+                    'product_id': hit.entity.product_id,
+                    'category': hit.entity.category,
+                    'metadata': hit.entity.metadata,
+                    'score': hit.score
+                })
 
         # Create product ID to result mapping for faster lookup
         image_results_map = {r['product_id']: r for r in image_search_results}
@@ -137,6 +382,166 @@ class MilvusDualSearch:
         # Return at least 5 results, but no more than top_k
         return sorted_results[0:max(top_k, 5)]
 
+    def fusion_search(
+        self,
+        text_embedding: Union[List[float], np.ndarray],
+        image_embedding: Union[List[float], np.ndarray],
+        top_k: int = 10,
+        text_threshold: float = 0.1,
+        image_threshold: float = 0.1,
+        category: Optional[str] = None,
+        fusion: str = "weighted",
+        rrf_k: int = 60,
+        filters: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        return self.fusion_search_batch(
+            [{
+                "text_embedding": text_embedding,
+                "image_embedding": image_embedding,
+                "category": category,
+                "filters": filters
+            }],
+            top_k=top_k,
+            text_threshold=text_threshold,
+            image_threshold=image_threshold,
+            fusion=fusion,
+            rrf_k=rrf_k
+        )[0]
+
+    def fusion_search_batch(
+        self,
+        queries: List[Dict[str, Any]],
+        top_k: int = 10,
+        text_threshold: float = 0.1,
+        image_threshold: float = 0.1,
+        fusion: str = "weighted",
+        rrf_k: int = 60
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Like search_batch, but cheaper on the wire.
+
+        The text and image ANN searches run concurrently and return only
+        product_id and score. Candidates are fused by product_id, either with
+        the text/image weights ("weighted", a product missing from one side
+        scores 0 there) or reciprocal rank fusion ("rrf", weight / (rrf_k + rank)).
+        category and metadata are then fetched for the final top_k products
+        only, in one query for the whole batch.
+
+        Returns the same fields as search(); with "rrf" the combined_score is
+        the fused rank score.
+        """
+        if fusion not in ("weighted", "rrf"):
+            raise ValueError(f"Unknown fusion method: {fusion}")
+        # Ensure minimum of 5 results
+        top_k = max(top_k, 5)
+
+        return self._cached_batch(
+            queries,
+            ("fusion", top_k, text_threshold, image_threshold, fusion, rrf_k,
+             self.search_params),
+            lambda batch: self._with_retry(
+                self._fusion_search_batch, batch, self._group_by_filter(batch),
+                top_k, text_threshold, image_threshold, fusion, rrf_k
+            )
+        )
+
+    def _fusion_search_batch(self, queries, groups, top_k, text_threshold, image_threshold, fusion, rrf_k):
+        self.ensure_loaded()
+
+        search_params = {
+            name: {"metric_type": "COSINE", "params": params} for name, params in self.search_params.items()
+        }
+        limit = max(top_k * 20, 200)
+
+        pending = []
+        for expr, indexes in groups.items():
+            text_embeddings = self._query_vectors(queries, indexes, "text_embedding")
+            image_embeddings = self._query_vectors(queries, indexes, "image_embedding")
+            text_future = self._executor.submit(
+                self.text_collection.search,
+                data=text_embeddings, anns_field="text_embedding", param=search_params["text_embedding"],
+                limit=limit, expr=expr, output_fields=["product_id"]
+            )
+            image_future = self._executor.submit(
+                self.image_collection.search,
+                data=image_embeddings, anns_field="image_embedding", param=search_params["image_embedding"],
+                limit=limit, expr=expr, output_fields=["product_id"]
+            )
+            pending.append((indexes, text_future, image_future))
+
+        ranked: List[List[Dict[str, Any]]] = [[] for _ in queries]
+        for indexes, text_future, image_future in pending:
+            for i, text_hits, image_hits in zip(indexes, text_future.result(), image_future.result()):
+                text_scores = self._hit_scores(text_hits, text_threshold)
+                image_scores = self._hit_scores(image_hits, image_threshold)
+                ranked[i] = self._fuse(text_scores, image_scores, fusion, rrf_k)[:top_k]
+
+        # Metadata only for what is actually returned
+        product_ids = list({r['product_id'] for results in ranked for r in results})
+        details = self._fetch_details(product_ids)
+        for results in ranked:
+            for result in results:
+                detail = details.get(result['product_id'], {})
+                result['category'] = detail.get('category')
+                result['metadata'] = detail.get('metadata')
+        return ranked
+
+    def _hit_scores(self, hits, threshold) -> Dict[str, float]:
+        """product_id -> best score, in rank order."""
+        scores: Dict[str, float] = {}
+        for hit in hits:
+            if hit.score < threshold:
+                continue
+            product_id = hit.entity.product_id
+            if product_id not in scores:
+                scores[product_id] = hit.score
+        return scores
+
+    def _fuse(self, text_scores, image_scores, fusion, rrf_k) -> List[Dict[str, Any]]:
+        if fusion == "rrf":
+            text_ranks = {pid: rank for rank, pid in enumerate(text_scores, start=1)}
+            image_ranks = {pid: rank for rank, pid in enumerate(image_scores, start=1)}
+
+        fused = []
+        for product_id in set(text_scores) | set(image_scores):
+            text_score = text_scores.get(product_id, 0.0)
+            image_score = image_scores.get(product_id, 0.0)
+            if fusion == "rrf":
+                combined_score = 0.0
+                if product_id in text_ranks:
+                    combined_score += self.text_weight / (rrf_k + text_ranks[product_id])
+                if product_id in image_ranks:
+                    combined_score += self.image_weight / (rrf_k + image_ranks[product_id])
+            else:
+                combined_score = self.text_weight * text_score + self.image_weight * image_score
+            fused.append({
+                'product_id': product_id,
+                'text_score': text_score,
+                'image_score': image_score,
+                'combined_score': combined_score
+            })
+        return sorted(fused, key=lambda x: x['combined_score'], reverse=True)
+
+    def _fetch_details(self, product_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        if not product_ids:
+            return {}
+        rows = self.text_collection.query(
+            expr=f"product_id in {json.dumps(product_ids)}",
+            output_fields=["product_id", "category", "metadata"]
+        )
+        return {row['product_id']: row for row in rows}
+
+    def _group_by_filter(self, queries: List[Dict[str, Any]]) -> Dict[Optional[str], List[int]]:
+        # The filter expression applies to every vector of a search call, so
+        # queries are grouped by filter; each group is a single nq>1 search.
+        # Built before searching: an invalid filter raises ValueError without
+        # touching (or reconnecting) the connection
+        groups: Dict[Optional[str], List[int]] = {}
+        for index, query in enumerate(queries):
+            expr = build_filter_expr(query.get("category"), query.get("filters"), self.promoted_fields)
+            groups.setdefault(expr, []).append(index)
+        return groups
+
     def _prepare_embedding(self, embedding: Union[List[float], np.ndarray]) -> np.ndarray:
         """Ensure embedding is a 2D numpy array."""
         if not isinstance(embedding, np.ndarray):
@@ -153,7 +558,8 @@ class MilvusDualSearch:
         top_k: int = 10,
         text_threshold: float = 0.7,
         image_threshold: float = 0.7,
-        category: Optional[str] = None
+        category: Optional[str] = None,
+        filters: Optional[Dict[str, Any]] = None
     ) -> List[Dict[str, Any]]:
         """
         Perform a hybrid search that incorporates keyword matching over metadata.
@@ -167,7 +573,8 @@ class MilvusDualSearch:
             top_k=top_k,
             text_threshold=text_threshold,
             image_threshold=image_threshold,
-            category=category
+            category=category,
+            filters=filters
         )
         
         if query_text and results:
@@ -178,4 +585,46 @@ class MilvusDualSearch:
                 result['combined_score'] = 0.8 * result['combined_score'] + 0.2 * text_match_score
             results = sorted(results, key=lambda x: x['combined_score'], reverse=True)
             
-        return results[0:max(top_k, 5)]
\ No newline at end of file
+        return results[0:max(top_k, 5)]
+
+
+_shared_search = None
+_shared_search_lock = threading.Lock()
+
+
+def get_shared_search(
+    host: str = "localhost",
+    port: str = "19530",
+    text_collection_name: str = "fashion_items_text",
+    image_collection_name: str = "fashion_items_image",
+    layout: Optional[str] = None,
+    backend: Optional[str] = None
+) -> MilvusDualSearch:
+    """
+    Process-wide MilvusDualSearch, connected and loaded on first use.
+
+    Safe to share across request threads; after a failed search it reconnects
+    through the underlying MilvusDualClient. backend picks Milvus or the
+    embedded local store (see milvus.store.create_client).
+    """
+    global _shared_search
+    if _shared_search is None:
+        with _shared_search_lock:
+            if _shared_search is None:
+                from milvus.store import create_client
+                milvus_client = create_client(
+                    backend=backend,
+                    host=host,
+                    port=port,
+                    text_collection_name=text_collection_name,
+                    image_collection_name=image_collection_name,
+                    layout=layout
+                )
+                search_client = MilvusDualSearch(
+                    text_collection=milvus_client.text_collection,
+                    image_collection=milvus_client.image_collection,
+                    reconnect=milvus_client.reconnect
+                )
+                search_client.ensure_loaded()
+                _shared_search = search_client
+    return _shared_search
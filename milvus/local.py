@@ -0,0 +1,588 @@
+# local.py
+"""
+Embedded vector store for small deployments, CI and edge replicas, where
+running a Milvus server is not worth it.
+
+LocalCollection implements the part of pymilvus.Collection that
+MilvusDualClient and MilvusDualSearch use (insert, upsert, delete, search,
+query, query_iterator, flush, load), so the client and search code run
+unchanged on top of it:
+
+    client = create_client(backend="local", local_path="/data/vectors")
+    search = MilvusDualSearch(client.text_collection, client.image_collection)
+
+Vectors are L2-normalized and appended to one raw float32 (or float16) file
+per vector field, memory-mapped when opened. Search is an exact dot product
+over the filtered rows in chunks; for a few hundred thousand products this
+is faster than a round trip to a server. Scalar fields are kept in memory
+and appended to a JSON-lines file. Writes become durable on flush(); one
+process should own a store at a time.
+"""
+import os
+import re
+import json
+import shutil
+import operator
+import threading
+import numpy as np
+from pymilvus import DataType
+from milvus.store import MilvusDualClient
+
+# Rows scored per matrix product; bounds the temporary float32 copy
+SEARCH_CHUNK_ROWS = int(os.getenv("LOCAL_SEARCH_CHUNK_ROWS", "65536"))
+
+VECTOR_TYPES = {DataType.FLOAT_VECTOR} | {
+    getattr(DataType, name) for name in ("FLOAT16_VECTOR", "BFLOAT16_VECTOR") if hasattr(DataType, name)
+}
+NUMERIC_TYPES = {
+    DataType.INT8, DataType.INT16, DataType.INT32, DataType.INT64, DataType.FLOAT, DataType.DOUBLE
+}
+
+_COMPARISONS = {
+    "==": operator.eq, "!=": operator.ne,
+    ">=": operator.ge, "<=": operator.le, ">": operator.gt, "<": operator.lt,
+}
+_CONDITION = re.compile(r'\s*(\w+)(?:\["([^"]*)"\])?\s*(==|!=|>=|<=|>|<|in\b)\s*')
+_AND = re.compile(r'\s+and\s+')
+_decoder = json.JSONDecoder()
+
+
+def parse_expr(expr):
+    """
+    Parse the boolean expressions this repo sends to Milvus: conditions of
+    the form field op value or metadata["key"] op value, joined by "and",
+    where op is a comparison or "in" and value is a JSON literal.
+
+    Returns a list of (field, json_key, op, value) tuples.
+    """
+    conditions = []
+    position = 0
+    while True:
+        match = _CONDITION.match(expr, position)
+        if match is None:
+            raise ValueError(f"Unsupported filter expression: {expr}")
+        field, json_key, op = match.groups()
+        try:
+            value, position = _decoder.raw_decode(expr, match.end())
+        except ValueError:
+            raise ValueError(f"Unsupported filter expression: {expr}")
+        conditions.append((field, json_key, op, value))
+        if not expr[position:].strip():
+            return conditions
+        match = _AND.match(expr, position)
+        if match is None:
+            raise ValueError(f"Unsupported filter expression: {expr}")
+        position = match.end()
+
+
+class LocalEntity(dict):
+    """Row fields, readable as attributes like pymilvus hit entities."""
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+class LocalHit:
+    __slots__ = ("id", "score", "entity")
+
+    def __init__(self, id, score, entity):
+        self.id = id
+        self.score = score
+        self.entity = entity
+
+    @property
+    def distance(self):
+        return self.score
+
+
+class LocalMutationResult:
+    def __init__(self, primary_keys=(), insert_count=0, delete_count=0):
+        self.primary_keys = list(primary_keys)
+        self.insert_count = insert_count
+        self.delete_count = delete_count
+
+
+class LocalQueryIterator:
+    def __init__(self, rows, batch_size):
+        self._rows = rows
+        self._batch_size = batch_size
+        self._position = 0
+
+    def next(self):
+        page = self._rows[self._position:self._position + self._batch_size]
+        self._position += len(page)
+        return page
+
+    def close(self):
+        self._rows = []
+
+
+class LocalCollection:
+    """
+    One collection stored in a directory:
+
+        <field>.vec     raw normalized vectors, one file per vector field
+        rows.jsonl      the scalar fields of every row, in insert order
+        deleted.jsonl   positions of deleted rows
+
+    Rows are addressed by their position; deletes only mark them until the
+    next compaction, which flush() runs once half the rows are deleted.
+    """
+
+    def __init__(self, path, schema, dtype="float32"):
+        self.path = path
+        self.schema = schema
+        self.name = os.path.basename(os.path.normpath(path))
+        self.dtype = np.dtype(dtype)
+        self._lock = threading.RLock()
+
+        self._vector_fields = {}
+        self._scalar_fields = []
+        self._numeric_fields = set()
+        self._primary_field = None
+        self._auto_id = False
+        for field in schema.fields:
+            if field.is_primary:
+                self._primary_field = field.name
+                self._auto_id = field.auto_id
+            if field.dtype in VECTOR_TYPES:
+                self._vector_fields[field.name] = int(field.params["dim"])
+            else:
+                self._scalar_fields.append(field.name)
+                if field.dtype in NUMERIC_TYPES:
+                    self._numeric_fields.add(field.name)
+        # Columns passed to insert(), in schema order
+        self._insert_fields = [
+            field.name for field in schema.fields
+            if not (field.is_primary and field.auto_id)
+        ]
+
+        os.makedirs(path, exist_ok=True)
+        self._open()
+
+    # Opening and persisting
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _open(self):
+        self._columns = {name: [] for name in self._scalar_fields}
+        rows_path = self._file("rows.jsonl")
+        if os.path.exists(rows_path):
+            with open(rows_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    row = json.loads(line)
+                    for name in self._scalar_fields:
+                        self._columns[name].append(row.get(name))
+
+        self._stored = {}
+        for name, dim in self._vector_fields.items():
+            self._stored[name] = self._map_vectors(name, dim)
+        # flush() appends the vector files before rows.jsonl, so a crash in
+        # between leaves vector files longer; cut them back so later appends
+        # stay aligned. Fewer vectors than rows cannot come from that (e.g. the
+        # files are read with the wrong dimension) and nothing is cut.
+        count = len(self._columns[self._scalar_fields[0]])
+        for name, vectors in self._stored.items():
+            if len(vectors) < count:
+                raise ValueError(
+                    f"{self._file(name + '.vec')} holds {len(vectors)} vectors of {self._vector_fields[name]} "
+                    f"dimensions for {count} rows; the collection was stored with another dimension or dtype"
+                )
+            if len(vectors) > count:
+                self._stored[name] = None
+                os.truncate(self._file(f"{name}.vec"), count * self._vector_fields[name] * self.dtype.itemsize)
+                self._stored[name] = self._map_vectors(name, self._vector_fields[name])
+
+        self._alive = np.ones(count, dtype=bool)
+        deleted_path = self._file("deleted.jsonl")
+        if os.path.exists(deleted_path):
+            with open(deleted_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        self._alive[[row for row in json.loads(line) if row < count]] = False
+
+        self._stored_count = count
+        self._tail = {name: [] for name in self._vector_fields}
+        self._tail_matrix = {}
+        self._pending_deletes = []
+        self._arrays = {}
+        ids = (self._columns.get(self._primary_field) or []) if self._auto_id else []
+        self._next_id = (max(ids) + 1) if ids else 0
+
+    def _map_vectors(self, name, dim):
+        path = self._file(f"{name}.vec")
+        row_bytes = dim * self.dtype.itemsize
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        if size < row_bytes:
+            return np.empty((0, dim), dtype=self.dtype)
+        return np.memmap(path, dtype=self.dtype, mode="r", shape=(size // row_bytes, dim))
+
+    def flush(self):
+        """Append unflushed rows and deletes to disk and re-map the vector files."""
+        with self._lock:
+            count = len(self._alive)
+            if count > self._stored_count:
+                for name, parts in self._tail.items():
+                    with open(self._file(f"{name}.vec"), "ab") as f:
+                        for part in parts:
+                            f.write(part.tobytes())
+                with open(self._file("rows.jsonl"), "a", encoding="utf-8") as f:
+                    for row in range(self._stored_count, count):
+                        f.write(json.dumps({name: self._columns[name][row] for name in self._scalar_fields}))
+                        f.write("\n")
+            if self._pending_deletes:
+                with open(self._file("deleted.jsonl"), "a", encoding="utf-8") as f:
+                    f.write(json.dumps(self._pending_deletes))
+                    f.write("\n")
+                self._pending_deletes = []
+
+            self._stored_count = count
+            self._tail = {name: [] for name in self._vector_fields}
+            self._tail_matrix = {}
+            for name, dim in self._vector_fields.items():
+                self._stored[name] = self._map_vectors(name, dim)[:count]
+
+            if count and np.count_nonzero(~self._alive) * 2 > count:
+                self._compact()
+
+    def _compact(self):
+        # Rewrite only the live rows, then reopen from the new files
+        live = np.flatnonzero(self._alive)
+        for name in self._vector_fields:
+            temporary = self._file(f"{name}.vec.tmp")
+            with open(temporary, "wb") as f:
+                for start in range(0, len(live), SEARCH_CHUNK_ROWS):
+                    f.write(np.ascontiguousarray(self._stored[name][live[start:start + SEARCH_CHUNK_ROWS]]).tobytes())
+            self._stored[name] = None
+            os.replace(temporary, self._file(f"{name}.vec"))
+        self._write_rows(self._file("rows.jsonl"), live)
+        if os.path.exists(self._file("deleted.jsonl")):
+            os.remove(self._file("deleted.jsonl"))
+        self._open()
+
+    def _write_rows(self, path, rows):
+        temporary = f"{path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps({name: self._columns[name][row] for name in self._scalar_fields}))
+                f.write("\n")
+        os.replace(temporary, path)
+
+    def load(self, *args, **kwargs):
+        """Vectors are mapped when the collection is opened; kept for API compatibility."""
+
+    def release(self, *args, **kwargs):
+        pass
+
+    def create_index(self, *args, **kwargs):
+        pass
+
+    def drop(self):
+        with self._lock:
+            self._stored = {}
+            shutil.rmtree(self.path, ignore_errors=True)
+
+    @property
+    def num_entities(self):
+        return int(np.count_nonzero(self._alive))
+
+    # Writes
+
+    def insert(self, data):
+        """Insert columns given in schema order (without an auto_id primary key)."""
+        if len(data) != len(self._insert_fields):
+            raise ValueError(f"Expected {len(self._insert_fields)} columns, got {len(data)}")
+        columns = dict(zip(self._insert_fields, data))
+        count = len(data[0])
+
+        vectors = {}
+        for name, dim in self._vector_fields.items():
+            matrix = np.asarray(columns[name], dtype=np.float32).reshape(count, -1)
+            if matrix.shape[1] != dim:
+                raise ValueError(f"{name} has dimension {matrix.shape[1]}, expected {dim}")
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            vectors[name] = (matrix / np.where(norms > 0, norms, 1)).astype(self.dtype)
+
+        with self._lock:
+            if self._auto_id:
+                columns[self._primary_field] = list(range(self._next_id, self._next_id + count))
+                self._next_id += count
+            for name in self._scalar_fields:
+                self._columns[name].extend(columns[name])
+            for name, matrix in vectors.items():
+                self._tail[name].append(matrix)
+            self._tail_matrix = {}
+            self._alive = np.concatenate([self._alive, np.ones(count, dtype=bool)])
+            self._arrays = {}
+        return LocalMutationResult(primary_keys=columns[self._primary_field], insert_count=count)
+
+    def upsert(self, data):
+        """Replace rows by primary key (collections with a user-provided primary key only)."""
+        if self._auto_id:
+            raise ValueError("upsert needs a collection whose primary key is not auto_id")
+        primary_keys = data[self._insert_fields.index(self._primary_field)]
+        with self._lock:
+            self.delete(f"{self._primary_field} in {json.dumps(list(primary_keys))}")
+            return self.insert(data)
+
+    def delete(self, expr):
+        with self._lock:
+            rows = np.flatnonzero(self._mask(expr))
+            self._alive[rows] = False
+            self._pending_deletes.extend(int(row) for row in rows)
+        return LocalMutationResult(delete_count=len(rows))
+
+    # Reads
+
+    def query(self, expr, output_fields=None, limit=None, **kwargs):
+        with self._lock:
+            rows = np.flatnonzero(self._mask(expr))
+            if limit is not None:
+                rows = rows[:limit]
+            return [self._entity(row, output_fields) for row in rows]
+
+    def query_iterator(self, batch_size=1000, expr=None, output_fields=None, **kwargs):
+        return LocalQueryIterator(self.query(expr, output_fields), batch_size)
+
+    def search(self, data, anns_field, param=None, limit=10, expr=None, output_fields=None, **kwargs):
+        """Exact cosine search; param (ef, nprobe, ...) is accepted and ignored."""
+        queries = np.asarray(data, dtype=np.float32).reshape(len(data), -1)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        queries = queries / np.where(norms > 0, norms, 1)
+
+        with self._lock:
+            candidates = np.flatnonzero(self._mask(expr))
+            stored = self._stored[anns_field]
+            tail = self._tail_rows(anns_field)
+            # Row positions are only valid against these columns: a compaction
+            # swaps in new, renumbered ones, while inserts only append
+            columns = self._columns
+
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        for start in range(0, len(candidates), SEARCH_CHUNK_ROWS):
+            rows = candidates[start:start + SEARCH_CHUNK_ROWS]
+            block = self._gather(stored, tail, rows)
+            scores = np.concatenate([best_scores, queries @ block.T], axis=1)
+            chunk_rows = np.concatenate([best_rows, np.broadcast_to(rows, (len(queries), len(rows)))], axis=1)
+            if scores.shape[1] > limit:
+                top = np.argpartition(-scores, limit - 1, axis=1)[:, :limit]
+                scores = np.take_along_axis(scores, top, axis=1)
+                chunk_rows = np.take_along_axis(chunk_rows, top, axis=1)
+            best_scores, best_rows = scores, chunk_rows
+
+        results = []
+        for scores, rows in zip(best_scores, best_rows):
+            order = np.argsort(-scores)
+            results.append([
+                LocalHit(columns[self._primary_field][rows[i]], float(scores[i]),
+                         self._entity(rows[i], output_fields, columns))
+                for i in order
+            ])
+        return results
+
+    def _tail_rows(self, name):
+        if name not in self._tail_matrix:
+            parts = self._tail[name]
+            dim = self._vector_fields[name]
+            self._tail_matrix[name] = np.concatenate(parts) if parts else np.empty((0, dim), dtype=self.dtype)
+        return self._tail_matrix[name]
+
+    def _gather(self, stored, tail, rows):
+        # rows are ascending; those past the mapped file are still in memory
+        split = np.searchsorted(rows, len(stored))
+        if split == len(rows):
+            block = stored[rows]
+        elif split == 0:
+            block = tail[rows - len(stored)]
+        else:
+            block = np.concatenate([stored[rows[:split]], tail[rows[split:] - len(stored)]])
+        return block.astype(np.float32, copy=False)
+
+    def _entity(self, row, output_fields, columns=None):
+        columns = self._columns if columns is None else columns
+        fields = [self._primary_field] + [
+            name for name in (output_fields or []) if name in columns and name != self._primary_field
+        ]
+        return LocalEntity((name, columns[name][row]) for name in fields)
+
+    def _mask(self, expr):
+        """Live rows matching expr (all live rows for an empty expr)."""
+        mask = self._alive.copy()
+        if not expr:
+            return mask
+        for field, json_key, op, value in parse_expr(expr):
+            if field not in self._columns:
+                raise ValueError(f"Unknown field in filter expression: {field}")
+            mask &= self._condition(field, json_key, op, value)
+        return mask
+
+    def _condition(self, field, json_key, op, value):
+        if json_key is not None:
+            values = [item.get(json_key) if isinstance(item, dict) else None for item in self._columns[field]]
+            return np.fromiter((_matches(item, op, value) for item in values), dtype=bool, count=len(values))
+
+        column = self._array(field)
+        if op == "in":
+            if field in self._numeric_fields:
+                return np.isin(column, value)
+            accepted = set(value)
+            return np.fromiter((item in accepted for item in column), dtype=bool, count=len(column))
+        if field in self._numeric_fields or op in ("==", "!="):
+            return np.asarray(_COMPARISONS[op](column, value), dtype=bool)
+        return np.fromiter((_matches(item, op, value) for item in column), dtype=bool, count=len(column))
+
+    def _array(self, field):
+        # Columns as numpy arrays for vectorized filters, rebuilt after inserts
+        if field not in self._arrays:
+            values = self._columns[field]
+            if field in self._numeric_fields:
+                self._arrays[field] = np.asarray(values, dtype=np.float64)
+            else:
+                array = np.empty(len(values), dtype=object)
+                array[:] = values
+                self._arrays[field] = array
+        return self._arrays[field]
+
+
+def _matches(item, op, value):
+    if op == "in":
+        return item in value
+    try:
+        return bool(_COMPARISONS[op](item, value))
+    except TypeError:
+        # Like Milvus, comparing a JSON value of another type is simply false
+        return False
+
+
+def _stored_vector_fields(directory, schema, dtype):
+    """Vector dimensions of an existing collection, worked out from its file sizes."""
+    rows_path = os.path.join(directory, "rows.jsonl")
+    if not os.path.exists(rows_path):
+        return {}
+    with open(rows_path, "r", encoding="utf-8") as f:
+        count = sum(1 for line in f if line.strip())
+    if not count:
+        return {}
+    stored = {}
+    for field in schema.fields:
+        path = os.path.join(directory, f"{field.name}.vec")
+        if field.dtype in VECTOR_TYPES and os.path.exists(path):
+            # Rounds down over the few extra vectors an interrupted flush may leave
+            stored[field.name] = {"dim": os.path.getsize(path) // (count * np.dtype(dtype).itemsize)}
+    return stored
+
+
+class LocalDualClient(MilvusDualClient):
+    """
+    MilvusDualClient on top of LocalCollection instead of a Milvus server.
+
+    Same collections, layouts and write API; the collections live in
+    directories under path. dtype (default: LOCAL_VECTOR_DTYPE env var,
+    float32) may be float16 to halve the vector files and memory.
+
+    Each directory's schema.json records the vector dimensions, type and
+    reducer the collection was created with; reopening it with other
+    reducers raises ValueError rather than misreading the vector files.
+    """
+
+    def __init__(self, path=".vectors", dtype=None, **kwargs):
+        self.path = path
+        self.dtype = dtype or os.getenv("LOCAL_VECTOR_DTYPE", "float32")
+        # Collection names, layout, filterable, reducers, ... as for MilvusDualClient
+        super().__init__(host=None, port=None, **kwargs)
+
+    def connect_to_milvus(self, host, port):
+        os.makedirs(self.path, exist_ok=True)
+        print(f"Using local vector store at {self.path}")
+
+    def reconnect(self):
+        # Nothing to reconnect to; the collections are in this process
+        return self.text_collection, self.image_collection
+
+    def _open_collection(self, name, build_schema):
+        directory = os.path.join(self.path, name)
+        settings_path = os.path.join(directory, "schema.json")
+        if os.path.exists(settings_path):
+            with open(settings_path, "r", encoding="utf-8") as f:
+                settings = json.load(f)
+            # Existing collections decide, whatever was asked for
+            self.filterable = settings.get("filterable", False)
+            dtype = settings.get("dtype", self.dtype)
+            stored = settings.get("vector_fields")
+            if stored:
+                self.vector_type = next(iter(stored.values()))["type"]
+            schema = build_schema()
+            if stored is None:
+                # schema.json from before vector fields were recorded
+                self._check_vector_fields(name, schema, _stored_vector_fields(directory, schema, dtype))
+                settings["vector_fields"] = self._vector_field_settings(schema)
+                with open(settings_path, "w", encoding="utf-8") as f:
+                    json.dump(settings, f)
+            else:
+                self._check_vector_fields(name, schema, stored)
+            print(f"Collection '{name}' already exists.")
+            return LocalCollection(directory, schema, dtype=dtype)
+
+        schema = build_schema()
+        collection = LocalCollection(directory, schema, dtype=self.dtype)
+        with open(settings_path, "w", encoding="utf-8") as f:
+            json.dump({
+                "filterable": self.filterable,
+                "dtype": self.dtype,
+                "vector_fields": self._vector_field_settings(schema),
+            }, f)
+        print(f"Created local collection '{name}'.")
+        return collection
+
+    def _vector_field_settings(self, schema):
+        settings = {}
+        for field in schema.fields:
+            if field.dtype in VECTOR_TYPES:
+                reducer = self.reducers.get(field.name)
+                settings[field.name] = {
+                    "dim": int(field.params["dim"]),
+                    "type": self.vector_type,
+                    "reducer": reducer.fingerprint if reducer is not None else None,
+                }
+        return settings
+
+    def _check_vector_fields(self, name, schema, stored):
+        """Refuse to open a collection with other dimensions or reducers than it was created with."""
+        for field, wanted in self._vector_field_settings(schema).items():
+            saved = stored.get(field)
+            if saved is None:
+                continue
+            if saved["dim"] != wanted["dim"] or saved.get("reducer", wanted["reducer"]) != wanted["reducer"]:
+                raise ValueError(
+                    f"Local collection '{name}' stores {field} with {saved['dim']} dimensions "
+                    f"(reducer {saved.get('reducer')}), but this client would use {wanted['dim']} "
+                    f"(reducer {wanted['reducer']}); set MILVUS_REDUCER_PATH as when it was created"
+                )
+
+    def create_text_collection_if_not_exists(self):
+        return self._open_collection(self.text_collection_name, self._text_schema)
+
+    def create_image_collection_if_not_exists(self):
+        return self._open_collection(self.image_collection_name, self._image_schema)
+
+    def create_unified_collection_if_not_exists(self):
+        return self._open_collection(self.unified_collection_name, self._unified_schema)
+
+    def drop_collections(self):
+        """Delete the collection directories."""
+        self._mark_written()
+        self.text_collection.drop()
+        if not self.unified:
+            self.image_collection.drop()
+        print(f"Dropped local collections under {self.path}.")
+
+    def close(self):
+        """Persist pending writes; there is no connection to close."""
+        self.flush()
@@ -0,0 +1,132 @@
+# migrate.py
+"""
+Copy the dual text/image collections into the unified single-collection layout.
+
+    python -m milvus.migrate --batch-size 1000
+
+Products are read from the text collection in pages, their image vectors are
+looked up in one query per page, and the merged rows are upserted into the
+unified collection (so the migration can be re-run safely). The unified
+schema needs both vectors, so products that only exist in one of the two
+collections are skipped: text-only ones while paging, image-only ones in a
+second pass over the image collection's product ids. Both are counted and
+the first few ids of each are printed.
+"""
+import argparse
+import json
+import time
+from pymilvus import Collection
+from milvus.store import MilvusDualClient
+
+# Orphan product ids printed per side; the rest are only counted
+ORPHAN_SAMPLE_SIZE = 20
+
+
+def image_only_products(image_collection, text_ids, batch_size):
+    """product_ids in the image collection that the text collection does not have."""
+    iterator = image_collection.query_iterator(
+        batch_size=batch_size,
+        expr='product_id != ""',
+        output_fields=["product_id"]
+    )
+    orphans = set()
+    while True:
+        page = iterator.next()
+        if not page:
+            iterator.close()
+            break
+        orphans.update(row["product_id"] for row in page if row["product_id"] not in text_ids)
+    return orphans
+
+
+def migrate(host, port, text_collection_name, image_collection_name, unified_collection_name, batch_size):
+    unified_client = MilvusDualClient(
+        host=host,
+        port=port,
+        layout="unified",
+        unified_collection_name=unified_collection_name
+    )
+    text_collection = Collection(text_collection_name)
+    image_collection = Collection(image_collection_name)
+    text_collection.load()
+    image_collection.load()
+
+    iterator = text_collection.query_iterator(
+        batch_size=batch_size,
+        expr='product_id != ""',
+        output_fields=["product_id", "text_embedding", "category", "metadata"]
+    )
+
+    started = time.time()
+    migrated = 0
+    skipped = 0
+    text_ids = set()
+    text_only = []
+    while True:
+        page = iterator.next()
+        if not page:
+            iterator.close()
+            break
+
+        product_ids = [row["product_id"] for row in page]
+        text_ids.update(product_ids)
+        image_rows = image_collection.query(
+            expr=f"product_id in {json.dumps(product_ids)}",
+            output_fields=["product_id", "image_embedding"]
+        )
+        image_embeddings = {row["product_id"]: row["image_embedding"] for row in image_rows}
+
+        # A product may appear more than once in the old auto-id collections;
+        # the last copy wins, same as the upsert would do
+        batch = {}
+        for row in page:
+            image_embedding = image_embeddings.get(row["product_id"])
+            if image_embedding is None:
+                skipped += 1
+                if len(text_only) < ORPHAN_SAMPLE_SIZE:
+                    text_only.append(row["product_id"])
+                continue
+            batch[row["product_id"]] = {
+                "product_id": row["product_id"],
+                "text_embedding": row["text_embedding"],
+                "image_embedding": image_embedding,
+                "category": row["category"],
+                "metadata": row["metadata"],
+            }
+
+        unified_client.upsert_entities(list(batch.values()), flush=False)
+        migrated += len(batch)
+        print(f"Migrated {migrated} products ({skipped} without image embedding, "
+              f"{migrated / (time.time() - started):.0f}/s)")
+
+    unified_client.flush()
+
+    image_only = image_only_products(image_collection, text_ids, batch_size)
+    print(f"Migration complete: {migrated} products copied into '{unified_collection_name}', "
+          f"{skipped} without image embedding, {len(image_only)} without text embedding.")
+    if text_only:
+        print(f"Text-only products (first {len(text_only)}): {', '.join(text_only)}")
+    if image_only:
+        print(f"Image-only products (first {min(len(image_only), ORPHAN_SAMPLE_SIZE)}): "
+              f"{', '.join(sorted(image_only)[:ORPHAN_SAMPLE_SIZE])}")
+    return migrated, skipped, len(image_only)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Copy the dual Milvus collections into the unified layout")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", default="19530")
+    parser.add_argument("--text-collection", default="fashion_items_text")
+    parser.add_argument("--image-collection", default="fashion_items_image")
+    parser.add_argument("--unified-collection", default="fashion_items")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    migrate(
+        args.host,
+        args.port,
+        args.text_collection,
+        args.image_collection,
+        args.unified_collection,
+        args.batch_size
+    )
@@ -0,0 +1,115 @@
+# query_cache.py
+import os
+import copy
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+
+CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "10000"))
+CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "300"))
+# Steps per unit of a normalized embedding component; 100 rounds to 0.01,
+# so re-encoded copies of the same crop usually share a key
+CACHE_QUANTIZATION = int(os.getenv("SEARCH_CACHE_QUANTIZATION", "100"))
+
+
+def quantize_embedding(embedding, steps=CACHE_QUANTIZATION):
+    """L2-normalize and round an embedding to int8 steps, as bytes for hashing."""
+    vector = np.asarray(embedding, dtype=np.float32).ravel()
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector = vector / norm
+    return np.clip(np.round(vector * steps), -127, 127).astype(np.int8).tobytes()
+
+
+class QueryResultCache:
+    """
+    In-process LRU cache of search results with a time-to-live.
+
+    Keys combine the quantized text and image embeddings with everything
+    else the result depends on (category, filters, top_k, thresholds, search
+    method). The whole cache is dropped when the collections' write
+    generation changes, so results never outlive an insert or upsert made
+    in this process; the TTL bounds staleness from writes made elsewhere.
+    Generations are increasing integers (see milvus.store.write_generation).
+    Safe to share between threads.
+    """
+
+    def __init__(self, max_entries=CACHE_SIZE, ttl=CACHE_TTL, quantization=CACHE_QUANTIZATION):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.quantization = quantization
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._generation = None
+        self._lock = threading.Lock()
+
+    def key(self, query, *parts):
+        digest = hashlib.sha1(quantize_embedding(query["text_embedding"], self.quantization))
+        digest.update(quantize_embedding(query["image_embedding"], self.quantization))
+        digest.update(json.dumps(
+            [query.get("category") or None, query.get("filters") or None] + list(parts),
+            sort_keys=True,
+            default=str
+        ).encode("utf-8"))
+        return digest.hexdigest()
+
+    def get(self, key, generation):
+        """Cached results for key, or None. Returns a copy the caller may modify."""
+        with self._lock:
+            self._check_generation(generation)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            stored_at, results = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return copy.deepcopy(results)
+
+    def put(self, key, results, generation):
+        """Store results computed at generation (read before the search ran)."""
+        results = copy.deepcopy(results)
+        with self._lock:
+            if self._generation is not None and generation < self._generation:
+                # A write landed while this search was running
+                return
+            self._check_generation(generation)
+            self._entries[key] = (time.monotonic(), results)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "expired": self.expired,
+                "invalidations": self.invalidations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def _check_generation(self, generation):
+        if generation != self._generation:
+            if self._generation is not None and self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+            self._generation = generation
@@ -0,0 +1,231 @@
+# reduce.py
+"""
+Dimensionality reduction and lower precision for the stored embeddings.
+
+    python -m milvus.reduce fit --method pca --dim 256 --output reducer.npz
+    python -m milvus.reduce report --dims 128,256,384 --precisions float32,float16,bfloat16
+
+fit trains one reducer per vector field (PCA, or a seeded Gaussian random
+projection) on a sample of the catalogue. With MILVUS_REDUCER_PATH pointing
+at the file, MilvusDualClient creates collections with the reduced
+dimension and reduces vectors on insert, and MilvusDualSearch reduces query
+vectors the same way. Existing collections keep their dimension; re-run the
+backfill (or milvus.migrate) into new collections.
+
+report measures, per field, recall@k of exact search over reduced and/or
+lower precision vectors against exact search at full precision, with the
+bytes stored per vector.
+"""
+import os
+import json
+import hashlib
+import argparse
+import numpy as np
+
+REDUCER_PATH = os.getenv("MILVUS_REDUCER_PATH")
+VECTOR_FIELDS = ("text_embedding", "image_embedding")
+PRECISION_BYTES = {"float32": 4, "float16": 2, "bfloat16": 2}
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if vectors.ndim == 1:
+        vectors = vectors.reshape(1, -1)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1)
+
+
+class VectorReducer:
+    """
+    Linear projection of L2-normalized embeddings to fewer dimensions.
+
+    Outputs are L2-normalized again, so COSINE search works unchanged.
+    """
+
+    def __init__(self, components, mean, method="pca"):
+        self.components = np.asarray(components, dtype=np.float32)
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.method = method
+
+    @property
+    def dim(self):
+        return self.components.shape[0]
+
+    @property
+    def input_dim(self):
+        return self.components.shape[1]
+
+    @property
+    def fingerprint(self):
+        """Short hash of the projection; equal for the same fitted reducer."""
+        digest = hashlib.sha256(self.method.encode("utf-8"))
+        digest.update(self.components.tobytes())
+        digest.update(self.mean.tobytes())
+        return digest.hexdigest()[:16]
+
+    @classmethod
+    def fit(cls, vectors, dim, method="pca", seed=0):
+        vectors = _normalize(vectors)
+        if dim >= vectors.shape[1]:
+            raise ValueError(f"Reduced dimension {dim} must be below {vectors.shape[1]}")
+        if method == "pca":
+            mean = vectors.mean(axis=0)
+            _, _, vt = np.linalg.svd(vectors - mean, full_matrices=False)
+            return cls(vt[:dim], mean, method)
+        if method == "random":
+            rng = np.random.default_rng(seed)
+            components = rng.normal(size=(dim, vectors.shape[1])) / np.sqrt(dim)
+            return cls(components, np.zeros(vectors.shape[1]), method)
+        raise ValueError(f"Unknown reduction method: {method}")
+
+    def transform(self, vectors):
+        """Reduce a vector or a batch of vectors; always returns a 2D float32 array."""
+        return _normalize((_normalize(vectors) - self.mean) @ self.components.T)
+
+    def explained_variance(self, vectors):
+        """Share of the (centered) variance of vectors kept by the projection."""
+        centered = _normalize(vectors) - self.mean
+        projected = centered @ self.components.T
+        return float((projected ** 2).sum() / (centered ** 2).sum())
+
+
+def save_reducers(path, reducers):
+    arrays = {}
+    for field, reducer in reducers.items():
+        arrays[f"{field}.components"] = reducer.components
+        arrays[f"{field}.mean"] = reducer.mean
+        arrays[f"{field}.method"] = np.array(reducer.method)
+    np.savez(path, **arrays)
+
+
+def load_reducers(path=None):
+    """Reducers by vector field from path (default MILVUS_REDUCER_PATH); empty without one."""
+    path = path or REDUCER_PATH
+    if not path:
+        return {}
+    reducers = {}
+    with np.load(path) as arrays:
+        for field in VECTOR_FIELDS:
+            if f"{field}.components" in arrays:
+                reducers[field] = VectorReducer(
+                    arrays[f"{field}.components"],
+                    arrays[f"{field}.mean"],
+                    str(arrays[f"{field}.method"])
+                )
+    return reducers
+
+
+def round_to_precision(vectors, precision):
+    """vectors as float32 after a round trip through the given storage precision."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if precision == "float16":
+        return vectors.astype(np.float16).astype(np.float32)
+    if precision == "bfloat16":
+        # Round to nearest even on the upper 16 bits
+        bits = vectors.view(np.uint32).astype(np.uint64)
+        bits = (bits + 0x7FFF + ((bits >> 16) & 1)) & 0xFFFF0000
+        return bits.astype(np.uint32).view(np.float32)
+    return vectors
+
+
+def report(samples, dims, precisions, method, k, queries_count, reducers=None, seed=0):
+    """Recall@k of every (dim, precision) variant against full precision, per field."""
+    from milvus.benchmark import exact_neighbours
+
+    results = []
+    for field, vectors in samples.items():
+        order = np.random.default_rng(seed).permutation(len(vectors))
+        queries = _normalize(vectors[order[:queries_count]])
+        base = _normalize(vectors[order[queries_count:]])
+        truth = exact_neighbours(base, queries, k)
+        full_dim = base.shape[1]
+
+        variants = [(None, full_dim)] + [(dim, dim) for dim in dims if dim < full_dim]
+        if reducers and field in reducers:
+            variants = [(None, full_dim), (reducers[field], reducers[field].dim)]
+        for variant, dim in variants:
+            if variant is None:
+                reducer = None
+            elif isinstance(variant, VectorReducer):
+                reducer = variant
+            else:
+                # Trained on the base set only, as it would be on the catalogue
+                reducer = VectorReducer.fit(base, variant, method)
+            reduced_base = reducer.transform(base) if reducer else base
+            reduced_queries = reducer.transform(queries) if reducer else queries
+            for precision in precisions:
+                found = exact_neighbours(
+                    round_to_precision(reduced_base, precision),
+                    round_to_precision(reduced_queries, precision),
+                    k
+                )
+                overlap = sum(len(set(a) & set(b)) for a, b in zip(found.tolist(), truth.tolist()))
+                bytes_per_vector = dim * PRECISION_BYTES[precision]
+                results.append({
+                    "field": field,
+                    "dim": dim,
+                    "method": reducer.method if reducer else None,
+                    "precision": precision,
+                    "recall": overlap / (len(queries) * k),
+                    "bytes_per_vector": bytes_per_vector,
+                    "compression": full_dim * 4 / bytes_per_vector,
+                    "explained_variance": reducer.explained_variance(base) if reducer else 1.0,
+                })
+                result = results[-1]
+                print(f"{field:<16} dim={dim:<4} {str(result['method'] or '-'):<6} {precision:<8} "
+                      f"recall@{k}={result['recall']:.4f}  {bytes_per_vector}B/vector "
+                      f"({result['compression']:.1f}x smaller)  variance kept={result['explained_variance']:.3f}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fit embedding reducers and report their recall")
+    parser.add_argument("command", choices=["fit", "report"])
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", default="19530")
+    parser.add_argument("--text-collection", default="fashion_items_text")
+    parser.add_argument("--image-collection", default="fashion_items_image",
+                        help="Same as --text-collection for the unified layout")
+    parser.add_argument("--sample", type=int, default=50000, help="Vectors read per field")
+    parser.add_argument("--method", choices=["pca", "random"], default="pca")
+    parser.add_argument("--dim", type=int, default=256, help="fit: reduced dimension")
+    parser.add_argument("--output", default="reducer.npz", help="fit: reducer file")
+    parser.add_argument("--reducer", help="report: evaluate this reducer file instead of fitting --dims")
+    parser.add_argument("--dims", default="128,256,384", help="report: reduced dimensions to try")
+    parser.add_argument("--precisions", default="float32,float16,bfloat16")
+    parser.add_argument("--queries", type=int, default=500, help="report: held-out query vectors")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--report-output", help="report: write the results to this JSON file")
+    args = parser.parse_args()
+
+    from pymilvus import connections
+    from milvus.benchmark import sample_vectors
+
+    connections.connect("default", host=args.host, port=args.port)
+    samples = {
+        "text_embedding": sample_vectors(args.text_collection, "text_embedding", args.sample),
+        "image_embedding": sample_vectors(args.image_collection, "image_embedding", args.sample),
+    }
+
+    if args.command == "fit":
+        reducers = {}
+        for field, vectors in samples.items():
+            reducers[field] = VectorReducer.fit(vectors, args.dim, args.method)
+            print(f"{field}: {args.method} to {args.dim} dims on {len(vectors)} vectors, "
+                  f"variance kept {reducers[field].explained_variance(vectors):.3f}")
+        save_reducers(args.output, reducers)
+        print(f"Saved reducers to {args.output}; set MILVUS_REDUCER_PATH={args.output} for new collections.")
+    else:
+        results = report(
+            samples,
+            [int(dim) for dim in args.dims.split(",") if dim],
+            [precision.strip() for precision in args.precisions.split(",")],
+            args.method,
+            args.top_k,
+            args.queries,
+            reducers=load_reducers(args.reducer) if args.reducer else None
+        )
+        if args.report_output:
+            with open(args.report_output, "w") as f:
+                json.dump(results, f, indent=2)
+            print(f"Wrote {len(results)} results to {args.report_output}")
@@ -1,4 +1,8 @@
 # store.py
+import os
+import json
+import math
+import threading
 import numpy as np
 from pymilvus import (
     connections,
@@ -8,6 +12,8 @@ from pymilvus import (
     DataType,
     Collection,
 )
+from pymilvus.exceptions import MilvusException
+from milvus.reduce import load_reducers
 
 class MilvusDualClient:
     def __init__(
@@ -15,42 +21,204 @@ class MilvusDualClient:
         host="localhost",
         port="19530",
         text_collection_name="fashion_items_text",
-        image_collection_name="fashion_items_image"
+        image_collection_name="fashion_items_image",
+        layout=None,
+        unified_collection_name="fashion_items",
+        filterable=None,
+        index_type=None,
+        index_params=None,
+        vector_type=None,
+        reducers=None
     ):
+        """
+        layout is "dual" (separate text and image collections, the default) or
+        "unified" (one collection, one entity per product holding both
+        vectors, keyed by product_id). Defaults to the MILVUS_LAYOUT env var.
+        With the unified layout text_collection and image_collection are the
+        same Collection, so callers (e.g. MilvusDualSearch) work unchanged.
+
+        filterable (default: MILVUS_FILTERABLE env var) creates new collections
+        with category as the partition key and brand, source, price and
+        discounted_price promoted from the metadata JSON to typed, indexed
+        scalar fields. For existing collections it is read from their schema.
+
+        index_type and index_params (build parameters, e.g. {"M": 8,
+        "efConstruction": 64}) set the vector index of new collections;
+        they default to the MILVUS_INDEX_TYPE and MILVUS_INDEX_PARAMS (JSON)
+        env vars, then to HNSW with DEFAULT_INDEX_PARAMS. Pick them with
+        python -m milvus.benchmark.
+
+        vector_type (default: MILVUS_VECTOR_TYPE env var, float32) may be
+        float16 or bfloat16 to halve vector storage; quantized index types
+        (IVF_SQ8, IVF_PQ) are picked with index_type. reducers (default:
+        loaded from MILVUS_REDUCER_PATH, see milvus.reduce) project vectors
+        to fewer dimensions before they are stored. Both only shape new
+        collections; existing ones are read back from their schema.
+        """
+        self.host = host
+        self.port = port
+        self.layout = layout or os.getenv("MILVUS_LAYOUT", "dual")
+        if self.layout not in ("dual", "unified"):
+            raise ValueError(f"Unknown Milvus layout: {self.layout}")
         self.text_collection_name = text_collection_name
         self.image_collection_name = image_collection_name
+        self.unified_collection_name = unified_collection_name
         self.dimension = 768
+        if filterable is None:
+            filterable = os.getenv("MILVUS_FILTERABLE", "") in ("1", "true", "yes")
+        self.filterable = filterable
+        self.index_type = index_type or os.getenv("MILVUS_INDEX_TYPE", "HNSW")
+        if index_params is None:
+            index_params = _json_env("MILVUS_INDEX_PARAMS", DEFAULT_INDEX_PARAMS.get(self.index_type, {}))
+        self.index_params = index_params
+        self.vector_type = vector_type or os.getenv("MILVUS_VECTOR_TYPE", "float32")
+        if self.vector_type not in VECTOR_DATA_TYPES:
+            raise ValueError(f"Unknown vector type: {self.vector_type}")
+        self.reducers = reducers if reducers is not None else load_reducers()
         self.connect_to_milvus(host, port)
-        self.text_collection = self.create_text_collection_if_not_exists()
-        self.image_collection = self.create_image_collection_if_not_exists()
+        if self.unified:
+            self.text_collection = self.image_collection = self.create_unified_collection_if_not_exists()
+        else:
+            self.text_collection = self.create_text_collection_if_not_exists()
+            self.image_collection = self.create_image_collection_if_not_exists()
+        # Existing collections decide, whatever was asked for
+        self.filterable = has_promoted_fields(self.text_collection)
+        self.vector_fields = {
+            **vector_fields(self.text_collection),
+            **vector_fields(self.image_collection)
+        }
+        check_reducers(
+            self.vector_fields,
+            self.reducers,
+            collections=(self.text_collection, self.image_collection),
+            dimension=self.dimension
+        )
+
+    @property
+    def unified(self):
+        return self.layout == "unified"
         
     def connect_to_milvus(self, host, port):
         # Update host if accessing from a remote machine (e.g. EC2 public IP)
         connections.connect("default", host=host, port=port)
         print(f"Connected to Milvus server at {host}:{port}")
         
+    def reconnect(self):
+        """Drop the (possibly broken) connection and re-open both collections."""
+        try:
+            connections.disconnect("default")
+        except Exception as e:
+            print(f"Error disconnecting from Milvus: {str(e)}")
+        self.connect_to_milvus(self.host, self.port)
+        if self.unified:
+            self.text_collection = self.image_collection = Collection(self.unified_collection_name)
+        else:
+            self.text_collection = Collection(self.text_collection_name)
+            self.image_collection = Collection(self.image_collection_name)
+        return self.text_collection, self.image_collection
+
+    def vector_index_params(self):
+        return {
+            "metric_type": "COSINE",
+            "index_type": self.index_type,
+            "params": self.index_params
+        }
+
+    def _vector_field(self, name):
+        reducer = self.reducers.get(name)
+        return FieldSchema(name=name, dtype=VECTOR_DATA_TYPES[self.vector_type],
+                           dim=reducer.dim if reducer is not None else self.dimension)
+
+    def _vector_column(self, batch, name):
+        """One vector field of a batch, reduced and encoded as the collection stores it."""
+        return encode_vectors(
+            [entity[name] for entity in batch],
+            self.vector_fields[name][0],
+            self.reducers.get(name)
+        )
+
+    def _category_field(self):
+        # As the partition key, a category filter only touches that partition
+        return FieldSchema(name="category", dtype=DataType.VARCHAR, max_length=100,
+                           is_partition_key=self.filterable)
+
+    def _promoted_fields(self):
+        if not self.filterable:
+            return []
+        return [
+            FieldSchema(name="brand", dtype=DataType.VARCHAR, max_length=200),
+            FieldSchema(name="source", dtype=DataType.VARCHAR, max_length=100),
+            FieldSchema(name="price", dtype=DataType.FLOAT),
+            FieldSchema(name="discounted_price", dtype=DataType.FLOAT),
+        ]
+
+    def _create_promoted_indexes(self, collection):
+        if not self.filterable:
+            return
+        collection.create_index(field_name="brand", index_name="brand_idx")
+        collection.create_index(field_name="source", index_name="source_idx")
+        collection.create_index(field_name="price", index_name="price_idx", index_params={"index_type": "STL_SORT"})
+        collection.create_index(field_name="discounted_price", index_name="discounted_price_idx",
+                                index_params={"index_type": "STL_SORT"})
+
+    def _promoted_columns(self, batch):
+        """brand/source/price columns taken from each product's metadata."""
+        if not self.filterable:
+            return []
+        metadatas = [entity["metadata"] or {} for entity in batch]
+        return [
+            [_text_value(metadata.get("brand"))[:200] for metadata in metadatas],
+            [_text_value(metadata.get("source"))[:100] for metadata in metadatas],
+            [_price_value(metadata.get("price")) for metadata in metadatas],
+            [_price_value(metadata.get("discounted_price")) for metadata in metadatas],
+        ]
+
+    def _description(self, description, names):
+        # Records which reducer (if any) each vector field was stored with
+        fingerprints = {name: self.reducers[name].fingerprint for name in names if name in self.reducers}
+        return f"{description}{REDUCERS_TAG}{json.dumps(fingerprints, sort_keys=True)}"
+
+    def _text_schema(self):
+        fields = [
+            FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
+            FieldSchema(name="product_id", dtype=DataType.VARCHAR, max_length=100),
+            self._vector_field("text_embedding"),
+            self._category_field(),
+            FieldSchema(name="metadata", dtype=DataType.JSON)
+        ] + self._promoted_fields()
+        return CollectionSchema(fields=fields, description=self._description("Fashion items text embeddings", ("text_embedding",)))
+
+    def _image_schema(self):
+        fields = [
+            FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
+            FieldSchema(name="product_id", dtype=DataType.VARCHAR, max_length=100),
+            self._vector_field("image_embedding"),
+            self._category_field(),
+            FieldSchema(name="metadata", dtype=DataType.JSON)
+        ] + self._promoted_fields()
+        return CollectionSchema(fields=fields, description=self._description("Fashion items image embeddings", ("image_embedding",)))
+
+    def _unified_schema(self):
+        fields = [
+            FieldSchema(name="product_id", dtype=DataType.VARCHAR, max_length=100, is_primary=True, auto_id=False),
+            self._vector_field("text_embedding"),
+            self._vector_field("image_embedding"),
+            self._category_field(),
+            FieldSchema(name="metadata", dtype=DataType.JSON)
+        ] + self._promoted_fields()
+        return CollectionSchema(fields=fields, description=self._description("Fashion items text and image embeddings", ("text_embedding", "image_embedding")))
+
     def create_text_collection_if_not_exists(self):
         if utility.has_collection(self.text_collection_name):
             print(f"Collection '{self.text_collection_name}' already exists.")
             return Collection(self.text_collection_name)
         
-        fields = [
-            FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
-            FieldSchema(name="product_id", dtype=DataType.VARCHAR, max_length=100),
-            FieldSchema(name="text_embedding", dtype=DataType.FLOAT_VECTOR, dim=self.dimension),
-            FieldSchema(name="category", dtype=DataType.VARCHAR, max_length=100),
-            FieldSchema(name="metadata", dtype=DataType.JSON)
-        ]
-        schema = CollectionSchema(fields=fields, description="Fashion items text embeddings")
-        collection = Collection(name=self.text_collection_name, schema=schema)
-        index_params = {
-            "metric_type": "COSINE",
-            "index_type": "HNSW",
-            "params": {"M": 8, "efConstruction": 64}
-        }
+        collection = Collection(name=self.text_collection_name, schema=self._text_schema())
+        index_params = self.vector_index_params()
         collection.create_index(field_name="text_embedding", index_params=index_params)
         # Create index on category field if needed for filtering
         collection.create_index(field_name="category", index_name="category_idx")
+        self._create_promoted_indexes(collection)
         print(f"Created text collection '{self.text_collection_name}' with indexes.")
         return collection
 
@@ -59,54 +227,132 @@ class MilvusDualClient:
             print(f"Collection '{self.image_collection_name}' already exists.")
             return Collection(self.image_collection_name)
         
-        fields = [
-            FieldSchema(name="id", dtype=DataType.INT64, is_primary=True, auto_id=True),
-            FieldSchema(name="product_id", dtype=DataType.VARCHAR, max_length=100),
-            FieldSchema(name="image_embedding", dtype=DataType.FLOAT_VECTOR, dim=self.dimension),
-            FieldSchema(name="category", dtype=DataType.VARCHAR, max_length=100),
-            FieldSchema(name="metadata", dtype=DataType.JSON)
-        ]
-        schema = CollectionSchema(fields=fields, description="Fashion items image embeddings")
-        collection = Collection(name=self.image_collection_name, schema=schema)
-        index_params = {
-            "metric_type": "COSINE",
-            "index_type": "HNSW",
-            "params": {"M": 8, "efConstruction": 64}
-        }
+        collection = Collection(name=self.image_collection_name, schema=self._image_schema())
+        index_params = self.vector_index_params()
         collection.create_index(field_name="image_embedding", index_params=index_params)
         collection.create_index(field_name="category", index_name="category_idx")
+        self._create_promoted_indexes(collection)
         print(f"Created image collection '{self.image_collection_name}' with indexes.")
         return collection
 
+    def create_unified_collection_if_not_exists(self):
+        if utility.has_collection(self.unified_collection_name):
+            print(f"Collection '{self.unified_collection_name}' already exists.")
+            return Collection(self.unified_collection_name)
+
+        collection = Collection(name=self.unified_collection_name, schema=self._unified_schema())
+        index_params = self.vector_index_params()
+        collection.create_index(field_name="text_embedding", index_params=index_params)
+        collection.create_index(field_name="image_embedding", index_params=index_params)
+        collection.create_index(field_name="category", index_name="category_idx")
+        self._create_promoted_indexes(collection)
+        print(f"Created unified collection '{self.unified_collection_name}' with indexes.")
+        return collection
+
     def insert_entity(self, product_id, text_embedding, image_embedding, category, metadata):
+        text_result, image_result = self.insert_entities([{
+            "product_id": product_id,
+            "text_embedding": text_embedding,
+            "image_embedding": image_embedding,
+            "category": category,
+            "metadata": metadata,
+        }])
+        print(f"Inserted entity with product ID: {product_id} into both text and image collections.")
+        return text_result, image_result
+
+    def insert_entities(self, batch, flush=True):
+        """
+        Insert many products in one columnar request per collection.
+
+        Args:
+            batch: List of dicts with product_id, text_embedding, image_embedding,
+                category and metadata keys (same fields as insert_entity).
+            flush: Flush both collections after the insert. Pass False when the
+                caller flushes once at the end of a bulk load.
+        """
+        if not batch:
+            return None, None
+
+        if self.unified:
+            result = self.text_collection.insert(self._unified_columns(batch))
+            self._mark_written()
+            if flush:
+                self.flush()
+            return result, result
+
+        product_ids = [entity["product_id"] for entity in batch]
+        categories = [entity["category"] for entity in batch]
+        metadatas = [entity["metadata"] for entity in batch]
+
+        promoted = self._promoted_columns(batch)                # brand, source, prices
+
         # Insert into text collection
-        text_entities = [
-            [product_id],           # product_id
-            [text_embedding],       # text_embedding (list of 768 floats)
-            [category],             # category prefilter
-            [metadata]              # metadata (JSON)
-        ]
-        text_result = self.text_collection.insert(text_entities)
-        self.text_collection.flush()
-        
+        text_result = self.text_collection.insert([
+            product_ids,                                        # product_id
+            self._vector_column(batch, "text_embedding"),       # text_embedding
+            categories,                                         # category prefilter
+            metadatas                                           # metadata (JSON)
+        ] + promoted)
+
         # Insert into image collection
-        image_entities = [
-            [product_id],           # product_id
-            [image_embedding],      # image_embedding (list of 768 floats)
-            [category],             # category prefilter
-            [metadata]              # metadata (JSON)
-        ]
-        image_result = self.image_collection.insert(image_entities)
-        self.image_collection.flush()
-        
-        print(f"Inserted entity with product ID: {product_id} into both text and image collections.")
+        image_result = self.image_collection.insert([
+            product_ids,                                        # product_id
+            self._vector_column(batch, "image_embedding"),      # image_embedding
+            categories,                                         # category prefilter
+            metadatas                                           # metadata (JSON)
+        ] + promoted)
+        self._mark_written()
+
+        if flush:
+            self.flush()
         return text_result, image_result
 
+    def upsert_entities(self, batch, flush=True):
+        """Insert or replace many products, keyed by product_id."""
+        if not batch:
+            return None, None
+        if self.unified:
+            # product_id is the primary key, so Milvus replaces in place
+            result = self.text_collection.upsert(self._unified_columns(batch))
+            self._mark_written()
+            if flush:
+                self.flush()
+            return result, result
+        self.delete_entities([entity["product_id"] for entity in batch])
+        return self.insert_entities(batch, flush=flush)
+
+    def _unified_columns(self, batch):
+        return [
+            [entity["product_id"] for entity in batch],         # product_id (primary key)
+            self._vector_column(batch, "text_embedding"),       # text_embedding
+            self._vector_column(batch, "image_embedding"),      # image_embedding
+            [entity["category"] for entity in batch],           # category prefilter
+            [entity["metadata"] for entity in batch]            # metadata (JSON)
+        ] + self._promoted_columns(batch)                       # brand, source, prices
+
+    def _mark_written(self):
+        mark_written(self.text_collection.name, self.image_collection.name)
+
+    def flush(self):
+        """Seal pending segments in both collections."""
+        self.text_collection.flush()
+        if not self.unified:
+            self.image_collection.flush()
+
     def upsert_entity(self, product_id, text_embedding, image_embedding, category, metadata):
         """
         Upsert an entity: If an entity with the given product_id exists,
         delete it from both collections before inserting the new data.
         """
+        if self.unified:
+            return self.upsert_entities([{
+                "product_id": product_id,
+                "text_embedding": text_embedding,
+                "image_embedding": image_embedding,
+                "category": category,
+                "metadata": metadata,
+            }])
+
         expr = f'product_id == "{product_id}"'
         print(f"Upsert: Deleting existing records with product_id: {product_id}")
         
@@ -117,12 +363,62 @@ class MilvusDualClient:
         # Delete from image collection
         self.image_collection.delete(expr)
         self.image_collection.flush()
+        self._mark_written()
         
         # Insert the new record
         return self.insert_entity(product_id, text_embedding, image_embedding, category, metadata)
     
+    def stored_product_ids(self, batch_size=5000):
+        """
+        Return the product_ids stored in each collection as two sets.
+
+        Uses a paginated query iterator so the full id list is pulled in a
+        handful of round-trips without hitting the query result window limit.
+        Both collections must be loaded.
+        """
+        if self.unified:
+            # Both vectors live in one entity, so nothing can be half-written
+            product_ids = self._collect_product_ids(self.text_collection, batch_size)
+            return product_ids, product_ids
+        return (
+            self._collect_product_ids(self.text_collection, batch_size),
+            self._collect_product_ids(self.image_collection, batch_size),
+        )
+
+    def _collect_product_ids(self, collection, batch_size):
+        product_ids = set()
+        iterator = collection.query_iterator(
+            batch_size=batch_size,
+            expr='product_id != ""',
+            output_fields=["product_id"]
+        )
+        while True:
+            page = iterator.next()
+            if not page:
+                iterator.close()
+                break
+            product_ids.update(row["product_id"] for row in page)
+        return product_ids
+
+    def delete_entities(self, product_ids, batch_size=1000):
+        """Delete the given product_ids from both collections."""
+        product_ids = list(product_ids)
+        for start in range(0, len(product_ids), batch_size):
+            expr = f"product_id in {json.dumps(product_ids[start:start + batch_size])}"
+            self.text_collection.delete(expr)
+            if not self.unified:
+                self.image_collection.delete(expr)
+        self._mark_written()
+        self.flush()
+        print(f"Deleted {len(product_ids)} products from both collections.")
+
     def drop_collections(self):
         """Drop both collections."""
+        self._mark_written()
+        if self.unified:
+            utility.drop_collection(self.unified_collection_name)
+            print(f"Dropped collection '{self.unified_collection_name}'.")
+            return
         utility.drop_collection(self.text_collection_name)
         utility.drop_collection(self.image_collection_name)
         print(f"Dropped collections '{self.text_collection_name}' and '{self.image_collection_name}'.")
@@ -130,4 +426,266 @@ class MilvusDualClient:
     def close(self):
         """Disconnect from Milvus."""
         connections.disconnect("default")
-        print("Disconnected from Milvus server.")
\ No newline at end of file
+        print("Disconnected from Milvus server.")
+
+
+# Build parameters per vector index type, used unless MILVUS_INDEX_PARAMS is set
+DEFAULT_INDEX_PARAMS = {
+    "HNSW": {"M": 8, "efConstruction": 64},
+    "IVF_FLAT": {"nlist": 1024},
+    "IVF_SQ8": {"nlist": 1024},
+    "IVF_PQ": {"nlist": 1024, "m": 48, "nbits": 8},
+    "DISKANN": {},
+    "FLAT": {},
+}
+
+# Search parameters per index type, used unless MILVUS_SEARCH_PARAMS is set.
+# HNSW's ef must be at least the search limit (200 in MilvusDualSearch)
+DEFAULT_SEARCH_PARAMS = {
+    "HNSW": {"ef": 250},
+    "IVF_FLAT": {"nprobe": 16},
+    "IVF_SQ8": {"nprobe": 16},
+    "IVF_PQ": {"nprobe": 16},
+    "DISKANN": {"search_list": 250},
+    "FLAT": {},
+}
+
+
+def _json_env(name, default):
+    value = os.getenv(name)
+    return json.loads(value) if value else default
+
+
+def default_search_params(index_type=None):
+    """
+    Search parameters from MILVUS_SEARCH_PARAMS, or the defaults for
+    index_type (the collection's index, see built_index_type), falling back
+    to MILVUS_INDEX_TYPE when that is unknown.
+    """
+    index_type = index_type or os.getenv("MILVUS_INDEX_TYPE", "HNSW")
+    return _json_env("MILVUS_SEARCH_PARAMS", DEFAULT_SEARCH_PARAMS.get(index_type, {}))
+
+
+def built_index_type(collection, field_name):
+    """Type of the index built on field_name, or None if there is none (or no index API)."""
+    try:
+        # Scalar fields may have indexes of their own; pick the vector field's
+        for index in collection.indexes:
+            if index.field_name == field_name:
+                return index.params.get("index_type")
+    except (MilvusException, AttributeError):
+        pass
+    return None
+
+
+# Appended to collection descriptions, followed by the reducer fingerprints
+REDUCERS_TAG = " reducers="
+
+# Stored for products without a usable price; price filters exclude it
+MISSING_PRICE = -1.0
+
+# Bumped on every write made through this process, so in-process search
+# caches can tell their results may be stale
+_write_generations = {}
+_write_generations_lock = threading.Lock()
+
+
+def mark_written(*collection_names):
+    with _write_generations_lock:
+        for name in set(collection_names):
+            _write_generations[name] = _write_generations.get(name, 0) + 1
+
+
+def write_generation(*collection_names):
+    """Increasing counter of the writes made to the given collections."""
+    return sum(_write_generations.get(name, 0) for name in set(collection_names))
+
+
+def create_client(backend=None, local_path=None, **kwargs):
+    """
+    Open the configured vector store backend.
+
+    backend is "milvus" (a Milvus server, the default) or "local" (the
+    embedded store in milvus.local, kept under local_path); it defaults to
+    the VECTOR_BACKEND env var and local_path to LOCAL_VECTOR_PATH. Other
+    arguments are passed to the client, host and port only to Milvus.
+    """
+    backend = backend or os.getenv("VECTOR_BACKEND", "milvus")
+    if backend == "local":
+        from milvus.local import LocalDualClient
+        kwargs.pop("host", None)
+        kwargs.pop("port", None)
+        return LocalDualClient(path=local_path or os.getenv("LOCAL_VECTOR_PATH", ".vectors"), **kwargs)
+    if backend != "milvus":
+        raise ValueError(f"Unknown vector store backend: {backend}")
+    return MilvusDualClient(**kwargs)
+
+
+VECTOR_DATA_TYPES = {
+    "float32": DataType.FLOAT_VECTOR,
+    "float16": DataType.FLOAT16_VECTOR,
+    "bfloat16": DataType.BFLOAT16_VECTOR,
+}
+
+
+def vector_fields(collection):
+    """Vector fields of a collection as name -> (DataType, dim)."""
+    return {
+        field.name: (field.dtype, int(field.params["dim"]))
+        for field in collection.schema.fields
+        if field.dtype in VECTOR_DATA_TYPES.values()
+    }
+
+
+def reducer_fingerprints(collection):
+    """Reducer fingerprint per vector field recorded when collection was created; None if not recorded."""
+    description = collection.schema.description or ""
+    if REDUCERS_TAG not in description:
+        return None
+    return json.loads(description.rsplit(REDUCERS_TAG, 1)[1])
+
+
+def check_reducers(fields, reducers, collections=(), dimension=None):
+    """
+    Raise ValueError unless reducers are the ones the collections were created
+    with: same output dimension, and the same fitted reducer where the
+    collection recorded one. dimension is the unreduced embedding size, to
+    catch a reduced collection opened without its reducer.
+    """
+    for name, reducer in reducers.items():
+        if name in fields and fields[name][1] != reducer.dim:
+            raise ValueError(
+                f"{name} is stored with {fields[name][1]} dimensions but the reducer outputs {reducer.dim}; "
+                f"reducers only apply to collections created with them"
+            )
+    if dimension is not None:
+        for name, (_, dim) in fields.items():
+            if name not in reducers and dim != dimension:
+                raise ValueError(
+                    f"{name} is stored with {dim} dimensions but no reducer is set; "
+                    f"set MILVUS_REDUCER_PATH as when the collection was created"
+                )
+    for collection in collections:
+        recorded = reducer_fingerprints(collection)
+        if recorded is None:
+            continue
+        for name in vector_fields(collection):
+            current = reducers[name].fingerprint if name in reducers else None
+            if recorded.get(name) != current:
+                raise ValueError(
+                    f"'{collection.name}' stores {name} reduced with {recorded.get(name) or 'no reducer'}, "
+                    f"but the current reducer is {current or 'none'}; "
+                    f"set MILVUS_REDUCER_PATH as when the collection was created"
+                )
+
+
+def encode_vectors(vectors, data_type, reducer=None):
+    """
+    Vectors as pymilvus expects them for a field of data_type, after the
+    optional reducer: float32 rows unchanged, float16/bfloat16 as typed
+    numpy rows (bfloat16 needs the ml_dtypes package).
+    """
+    if reducer is not None:
+        vectors = reducer.transform(vectors)
+    if data_type == DataType.FLOAT16_VECTOR:
+        return list(np.asarray(vectors, dtype=np.float32).astype(np.float16))
+    if data_type == DataType.BFLOAT16_VECTOR:
+        import ml_dtypes
+        return list(np.asarray(vectors, dtype=np.float32).astype(ml_dtypes.bfloat16))
+    return list(vectors) if reducer is not None else vectors
+
+
+def has_promoted_fields(collection):
+    return any(field.name == "price" for field in collection.schema.fields)
+
+
+def _text_value(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return ""
+    return str(value)
+
+
+def _price_value(value):
+    try:
+        price = float(str(value).replace(",", "").strip())
+    except (TypeError, ValueError):
+        return MISSING_PRICE
+    return MISSING_PRICE if math.isnan(price) else price
+
+
+class BufferedMilvusWriter:
+    """
+    Thread-safe write buffer in front of MilvusDualClient.insert_entities.
+
+    Worker threads call add() for every product; rows are sent to Milvus as one
+    columnar batch once max_rows rows or roughly max_bytes bytes are pending.
+    Collections are flushed once on close() (or after every batch when
+    flush_each_batch is set) instead of after every row.
+    """
+
+    def __init__(self, client, max_rows=500, max_bytes=16 * 1024 * 1024, flush_each_batch=False):
+        self.client = client
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.flush_each_batch = flush_each_batch
+        self.inserted = 0
+        self.failed = 0
+        self._buffer = []
+        self._buffer_bytes = 0
+        self._lock = threading.Lock()
+
+    def add(self, product_id, text_embedding, image_embedding, category, metadata):
+        entity = {
+            "product_id": product_id,
+            "text_embedding": text_embedding,
+            "image_embedding": image_embedding,
+            "category": category,
+            "metadata": metadata,
+        }
+        with self._lock:
+            self._buffer.append(entity)
+            self._buffer_bytes += self._estimate_size(entity)
+            if len(self._buffer) < self.max_rows and self._buffer_bytes < self.max_bytes:
+                return
+            batch = self._take_buffer()
+        self._write(batch)
+
+    def close(self):
+        """Send whatever is still buffered and flush both collections."""
+        with self._lock:
+            batch = self._take_buffer()
+        self._write(batch)
+        self.client.flush()
+        print(f"Writer closed: {self.inserted} products inserted, {self.failed} failed.")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _take_buffer(self):
+        batch = self._buffer
+        self._buffer = []
+        self._buffer_bytes = 0
+        return batch
+
+    def _write(self, batch):
+        if not batch:
+            return
+        try:
+            self.client.insert_entities(batch, flush=self.flush_each_batch)
+        except Exception as e:
+            with self._lock:
+                self.failed += len(batch)
+            print(f"Error inserting batch of {len(batch)} products into Milvus: {str(e)}")
+            return
+        with self._lock:
+            self.inserted += len(batch)
+        print(f"Inserted batch of {len(batch)} products into both text and image collections.")
+
+    def _estimate_size(self, entity):
+        # Two float32 vectors plus the JSON payload, which dominates everything else
+        vector_bytes = 4 * (len(entity["text_embedding"]) + len(entity["image_embedding"]))
+        metadata_bytes = len(json.dumps(entity["metadata"], default=str))
+        return vector_bytes + metadata_bytes + len(entity["product_id"]) + len(entity["category"])
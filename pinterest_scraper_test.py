@@ -2,11 +2,9 @@ import requests
 import re
 import json
 import time
+import threading
 from urllib.parse import urlparse
 from bs4 import BeautifulSoup
-from PIL import Image
-from io import BytesIO
-import base64
 from tqdm import tqdm
 from multiprocessing.pool import ThreadPool
 from pydantic import HttpUrl
@@ -14,39 +12,39 @@ from pydantic import HttpUrl
 import get_clothing
 import get_llm
 import get_embeddings
+import images
 
-from milvus.store import MilvusDualClient
-from milvus.fetch import MilvusDualSearch
+from milvus.fetch import get_shared_search
 
 
 
 from instagrapi import Client
 
-cl = Client()
-cl.login("ayus.hkumar1357", "Yun@1357")
-cl.dump_settings("insta_session.json")
+_instagram_client = None
+_instagram_client_lock = threading.Lock()
+
+
+def get_instagram_client():
+    """Logged-in Instagram client, created on the first Instagram URL rather than at import."""
+    global _instagram_client
+    if _instagram_client is None:
+        with _instagram_client_lock:
+            if _instagram_client is None:
+                cl = Client()
+                cl.login("ayus.hkumar1357", "Yun@1357")
+                cl.dump_settings("insta_session.json")
+
+                cl = Client()
+                cl.load_settings("insta_session.json")
+                cl.login("ayus.hkumar1357", "Yun@1357")
+                _instagram_client = cl
+    return _instagram_client
 
-cl = Client()
-cl.load_settings("insta_session.json")
-cl.login("ayus.hkumar1357", "Yun@1357")
 
 def extract_shortcode(insta_url):
     match = re.search(r"instagram\.com/p/([^/]+)/", insta_url)
     return match.group(1) if match else None
 
-def encode_image(image_url):
-    """Encode an image from URL to base64"""
-    try:
-        response = requests.get(image_url, timeout=10)
-        if response.status_code != 200:
-            raise Exception(f"Failed to fetch image from URL: {image_url}")
-        image = Image.open(BytesIO(response.content)).convert("RGB")
-        buffered = BytesIO()
-        image.save(buffered, format="PNG")
-        return base64.b64encode(buffered.getvalue()).decode("utf-8")
-    except requests.exceptions.RequestException as e:
-        raise Exception(f"Request error for URL {image_url}: {str(e)}")
-
 def scrape_pinterest_board(board_url):
     """Scrape a Pinterest board or Instagram post and return pin/post data"""
     parsed_url = urlparse(board_url)
@@ -69,6 +67,7 @@ def scrape_pinterest_board(board_url):
             if not shortcode:
                 raise ValueError("Invalid Instagram post URL.")
 
+            cl = get_instagram_client()
             media_pk = cl.media_pk_from_url(board_url)
             media = cl.media_info(media_pk)
 
@@ -190,14 +189,14 @@ def process_pin(pin, search_client):
     try:
         # First try to get the image
         try:
-            image_b64 = encode_image(pin['image_url'])
+            image = images.fetch_image(pin['image_url'])
         except Exception as e:
-            print(f"Error encoding image for pin {pin['id']}: {str(e)}")
+            print(f"Error fetching image for pin {pin['id']}: {str(e)}")
             return []
 
         # Try to detect clothing items
         try:
-            cropped_items = get_clothing.detect_clothing_from_file(image_b64)
+            cropped_items = get_clothing.detect_clothing_from_file(image)
         except Exception as e:
             print(f"Error detecting clothing for pin {pin['id']}: {str(e)}")
             return []
@@ -207,8 +206,9 @@ def process_pin(pin, search_client):
             print(f"No clothing items detected for pin {pin['id']}")
             return []
             
-        processed_items = []
-
+        # Describe and embed every crop first, then look all of them up with
+        # a single batched search instead of one search per crop
+        analysed = []
         for idx, item in enumerate(cropped_items):
             try:
                 # Get LLM analysis of the clothing item
@@ -219,7 +219,7 @@ def process_pin(pin, search_client):
                 )
 
                 # Get embeddings for the item
-                img_emb, text_emb = get_embeddings.get_embeddings(
+                img_emb, text_emb = get_embeddings.get_batcher().embed(
                     item['image'],
                     llm_result['description']
                 )
@@ -228,49 +228,62 @@ def process_pin(pin, search_client):
                     print(f"Failed to get embeddings for item {idx} in pin {pin['id']}")
                     continue
 
-                # Get category and search for similar items
-                category = llm_result.get('dress_category', '')
-                results = search_client.search(
-                    text_embedding=text_emb,
-                    image_embedding=img_emb,
-                    top_k=5,
-                    text_threshold=0.7,
-                    image_threshold=0.7,
-                    category=category
-                )
-                
-                # Convert any HttpUrl objects to strings in results
-                for result in results:
-                    for key, value in result.items():
-                        if isinstance(value, HttpUrl):
-                            result[key] = str(value)
-                
-                if len(results) > 0:
-                    pin_exists = False
-                    for processed_item in processed_items:
-                        if processed_item['pin']['id'] == pin['id']:
-                            processed_item['detected_items'].append({
-                                'text': llm_result.get('short_text', ''),
-                                'box': item['box'],
-                                'similar_items': results,
-                                'similar_items_count': len(results)
-                            })
-                            pin_exists = True
-                            break
-                    
-                    if not pin_exists:
-                        processed_items.append({
-                            'pin': pin,
-                            'detected_items': [{
-                                'text': llm_result.get('short_text', ''), 
-                                'box': item['box'],
-                                'similar_items': results,
-                                'similar_items_count': len(results)
-                            }]
-                        })
+                analysed.append((item, llm_result, {
+                    "text_embedding": text_emb,
+                    "image_embedding": img_emb,
+                    "category": llm_result.get('dress_category', '')
+                }))
             except Exception as e:
                 print(f"Error processing item {idx} for pin {pin['id']}: {str(e)}")
                 continue
+
+        if not analysed:
+            return []
+
+        # Search for similar items
+        try:
+            all_results = search_client.fusion_search_batch(
+                [query for _, _, query in analysed],
+                top_k=5,
+                text_threshold=0.7,
+                image_threshold=0.7
+            )
+        except Exception as e:
+            print(f"Error searching similar items for pin {pin['id']}: {str(e)}")
+            return []
+
+        processed_items = []
+
+        for (item, llm_result, _), results in zip(analysed, all_results):
+            # Convert any HttpUrl objects to strings in results
+            for result in results:
+                for key, value in result.items():
+                    if isinstance(value, HttpUrl):
+                        result[key] = str(value)
+            
+            if len(results) > 0:
+                pin_exists = False
+                for processed_item in processed_items:
+                    if processed_item['pin']['id'] == pin['id']:
+                        processed_item['detected_items'].append({
+                            'text': llm_result.get('short_text', ''),
+                            'box': item['box'],
+                            'similar_items': results,
+                            'similar_items_count': len(results)
+                        })
+                        pin_exists = True
+                        break
+                
+                if not pin_exists:
+                    processed_items.append({
+                        'pin': pin,
+                        'detected_items': [{
+                            'text': llm_result.get('short_text', ''), 
+                            'box': item['box'],
+                            'similar_items': results,
+                            'similar_items_count': len(results)
+                        }]
+                    })
                 
         return processed_items
 
@@ -289,18 +302,13 @@ def scrape_and_process_pinterest_board(board_url, max_pins=None, num_threads=5):
     print(f"Found {len(pins)} pins")
     
     # Create Milvus clients before processing pins
-    milvus_client = MilvusDualClient(
+    search_client = get_shared_search(
         host="localhost", 
         port="19530", 
         text_collection_name="fashion_items_text", 
         image_collection_name="fashion_items_image"
     )
     
-    search_client = MilvusDualSearch(
-        text_collection=milvus_client.text_collection, 
-        image_collection=milvus_client.image_collection
-    )
-    
     print(f"Processing {len(pins)} pins...")
     with ThreadPool(num_threads) as pool:
         results = list(tqdm(
@@ -8,13 +8,11 @@ from tqdm import tqdm
 # Import modules from the original Pinterest scraper
 from pinterest_scraper_test import (
     scrape_pinterest_board,
-    process_pin,
-    encode_image
+    process_pin
 )
 
 # Import the Milvus client for vector search
-from milvus.store import MilvusDualClient
-from milvus.fetch import MilvusDualSearch
+from milvus.fetch import get_shared_search
 
 app = Flask(__name__)
 
@@ -24,21 +22,15 @@ CORS(app, resources={r"/*": {"origins": "*"}},
      allow_headers=["Content-Type", "Authorization", "Accept"],
      methods=["GET", "POST", "OPTIONS"])
 
-# Initialize Milvus client
+# One Milvus connection and loaded search client for the whole process,
+# shared by every request thread
 def get_search_client():
-    milvus_client = MilvusDualClient(
+    return get_shared_search(
         host="localhost", 
         port="19530", 
         text_collection_name="fashion_items_text", 
         image_collection_name="fashion_items_image"
     )
-    
-    search_client = MilvusDualSearch(
-        text_collection=milvus_client.text_collection, 
-        image_collection=milvus_client.image_collection
-    )
-    
-    return search_client
 
 @app.route('/api/scrape_pinterest', methods=['POST', 'OPTIONS'])
 def stream_pinterest_results():
@@ -166,6 +158,11 @@ def test_endpoint():
     """Simple test endpoint to check if the server is running"""
     return jsonify({"status": "ok", "message": "Server is running"}), 200
 
+@app.route('/api/search_cache', methods=['GET'])
+def search_cache_stats():
+    """Hit rate and size of the Milvus query result cache"""
+    return jsonify({"status": "ok", "cache": get_search_client().cache_stats()}), 200
+
 if __name__ == '__main__':
     # Enable debug logging
     import logging
@@ -0,0 +1,195 @@
+import threading
+import queue
+import time
+import traceback
+
+_STOP = object()
+
+
+class LatencyHistogram:
+    """
+    Fixed-bucket latency histogram; cheap enough to record every item.
+
+    Percentiles are the upper bound of the bucket they fall in.
+    """
+
+    BOUNDS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000, float("inf"))
+
+    def __init__(self):
+        self.counts = [0] * len(self.BOUNDS_MS)
+        self.total = 0
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        milliseconds = seconds * 1000
+        for index, bound in enumerate(self.BOUNDS_MS):
+            if milliseconds <= bound:
+                break
+        with self._lock:
+            self.counts[index] += 1
+            self.total += 1
+
+    def percentile(self, p):
+        with self._lock:
+            if not self.total:
+                return 0.0
+            threshold = self.total * p / 100
+            seen = 0
+            for bound, count in zip(self.BOUNDS_MS, self.counts):
+                seen += count
+                if seen >= threshold:
+                    return bound
+            return self.BOUNDS_MS[-1]
+
+    def buckets(self):
+        """{"<=bound ms": count} for the non-empty buckets."""
+        with self._lock:
+            return {f"<={bound:g}ms": count for bound, count in zip(self.BOUNDS_MS, self.counts) if count}
+
+
+class Stage:
+    """
+    One step of a Pipeline: `workers` threads pulling from a bounded input queue.
+
+    `func` takes an item and returns the item for the next stage, or None to
+    drop it (e.g. after logging a failure).
+    """
+
+    def __init__(self, name, func, workers=1, queue_size=100):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.processed = 0
+        self.dropped = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self.latency = LatencyHistogram()
+        self._lock = threading.Lock()
+
+    def _record(self, outcome, elapsed):
+        self.latency.record(elapsed)
+        with self._lock:
+            self.busy_seconds += elapsed
+            if outcome == "ok":
+                self.processed += 1
+            elif outcome == "dropped":
+                self.dropped += 1
+            else:
+                self.errors += 1
+
+    def stats(self, wall_seconds):
+        wall_seconds = max(wall_seconds, 1e-9)
+        with self._lock:
+            done = self.processed + self.dropped + self.errors
+            return {
+                "stage": self.name,
+                "workers": self.workers,
+                "processed": self.processed,
+                "dropped": self.dropped,
+                "errors": self.errors,
+                "queued": self.queue.qsize(),
+                "items_per_sec": done / wall_seconds,
+                "avg_latency_ms": 1000 * self.busy_seconds / done if done else 0.0,
+                "p50_latency_ms": self.latency.percentile(50),
+                "p99_latency_ms": self.latency.percentile(99),
+                # Fraction of worker time spent inside func; the stage closest
+                # to 1.0 with a full input queue is the bottleneck
+                "utilization": self.busy_seconds / (self.workers * wall_seconds),
+            }
+
+
+class Pipeline:
+    """
+    Chain of Stages connected by bounded queues.
+
+    Each stage has its own worker count so every external dependency can run
+    at its own concurrency limit; a full queue blocks the stage in front of it,
+    which keeps memory bounded and pushes backpressure up to the input.
+    """
+
+    def __init__(self, stages, on_result=None, report_interval=None):
+        self.stages = stages
+        self.on_result = on_result
+        self.report_interval = report_interval
+        self.started_at = None
+        self.finished_at = None
+
+    def run(self, items):
+        self.started_at = time.time()
+        threads = []
+        for index, stage in enumerate(self.stages):
+            next_stage = self.stages[index + 1] if index + 1 < len(self.stages) else None
+            stage_threads = [
+                threading.Thread(
+                    target=self._work,
+                    args=(stage, next_stage),
+                    name=f"{stage.name}-{i}",
+                    daemon=True
+                )
+                for i in range(stage.workers)
+            ]
+            for thread in stage_threads:
+                thread.start()
+            threads.append(stage_threads)
+
+        reporter_done = threading.Event()
+        if self.report_interval:
+            threading.Thread(target=self._report_loop, args=(reporter_done,), daemon=True).start()
+
+        for item in items:
+            self.stages[0].queue.put(item)
+
+        # Drain stage by stage: once every worker of a stage has exited, nothing
+        # more can reach the next one, so it is safe to stop it too
+        for stage, stage_threads in zip(self.stages, threads):
+            for _ in stage_threads:
+                stage.queue.put(_STOP)
+            for thread in stage_threads:
+                thread.join()
+
+        reporter_done.set()
+        self.finished_at = time.time()
+        return self.stats()
+
+    def _work(self, stage, next_stage):
+        while True:
+            item = stage.queue.get()
+            if item is _STOP:
+                break
+            start = time.perf_counter()
+            try:
+                result = stage.func(item)
+                outcome = "ok" if result is not None else "dropped"
+            except Exception:
+                print(f"Unhandled error in stage '{stage.name}'")
+                print(traceback.format_exc())
+                result = None
+                outcome = "error"
+            stage._record(outcome, time.perf_counter() - start)
+
+            if result is None:
+                continue
+            if next_stage is not None:
+                next_stage.queue.put(result)
+            elif self.on_result is not None:
+                self.on_result(result)
+
+    def _report_loop(self, done):
+        while not done.wait(self.report_interval):
+            print(self.report())
+
+    def stats(self):
+        end = self.finished_at or time.time()
+        wall_seconds = end - (self.started_at or end)
+        return [stage.stats(wall_seconds) for stage in self.stages]
+
+    def report(self):
+        lines = ["stage        workers  processed  dropped  errors  queued   items/s  avg ms  util"]
+        for s in self.stats():
+            lines.append(
+                f"{s['stage']:<12} {s['workers']:>7}  {s['processed']:>9}  {s['dropped']:>7}  "
+                f"{s['errors']:>6}  {s['queued']:>6}  {s['items_per_sec']:>8.2f}  "
+                f"{s['avg_latency_ms']:>6.0f}  {s['utilization']:>4.0%}"
+            )
+        return "\n".join(lines)
@@ -0,0 +1,169 @@
+"""
+Persistent cache of LLM descriptions and embeddings, keyed by image content.
+
+On by default: the cache is a SQLite file at .cache/results.sqlite3, relative
+to the working directory of the process, and holds up to 2 GB of values
+before evicting least-recently-used entries. RESULT_CACHE_PATH moves it,
+RESULT_CACHE_MAX_MB sizes it and RESULT_CACHE_DISABLED=1 turns it off.
+"""
+import os
+import json
+import time
+import base64
+import hashlib
+import sqlite3
+import threading
+import numpy as np
+
+CACHE_PATH = os.getenv("RESULT_CACHE_PATH", os.path.join(".cache", "results.sqlite3"))
+CACHE_MAX_BYTES = int(float(os.getenv("RESULT_CACHE_MAX_MB", "2048")) * 1024 * 1024)
+CACHE_ENABLED = os.getenv("RESULT_CACHE_DISABLED", "") not in ("1", "true", "yes")
+
+
+def content_key(image, *parts):
+    """
+    Hash of the image bytes plus anything else the result depends on
+    (prompt, model, text, ...). Base64 strings are decoded first so the key
+    only depends on the image content, not on how it was passed around.
+    """
+    if isinstance(image, str):
+        image = base64.b64decode(image)
+    digest = hashlib.sha256(image)
+    for part in parts:
+        digest.update(b"\0")
+        digest.update(str(part).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Persistent SQLite cache for LLM descriptions and embeddings.
+
+    Entries are evicted least-recently-used first once the stored values
+    exceed max_bytes. Safe to share between threads.
+    """
+
+    def __init__(self, path=CACHE_PATH, max_bytes=CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = {"llm": 0, "embedding": 0}
+        self.misses = {"llm": 0, "embedding": 0}
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    # LLM results are stored as their parsed JSON
+
+    def get_llm(self, key):
+        value = self._get("llm", key)
+        return json.loads(value) if value is not None else None
+
+    def put_llm(self, key, result):
+        self._put("llm", key, json.dumps(result).encode("utf-8"))
+
+    # Embeddings are stored as a pair of packed float32 vectors
+
+    def get_embeddings(self, key):
+        value = self._get("embedding", key)
+        if value is None:
+            return None
+        vectors = np.frombuffer(value, dtype=np.float32)
+        image_dim = int(vectors[0])
+        image_embedding = vectors[1:1 + image_dim]
+        text_embedding = vectors[1 + image_dim:]
+        return image_embedding.tolist(), text_embedding.tolist()
+
+    def put_embeddings(self, key, image_embedding, text_embedding):
+        image_embedding = np.asarray(image_embedding, dtype=np.float32).ravel()
+        text_embedding = np.asarray(text_embedding, dtype=np.float32).ravel()
+        packed = np.concatenate([
+            np.array([len(image_embedding)], dtype=np.float32),
+            image_embedding,
+            text_embedding
+        ])
+        self._put("embedding", key, packed.tobytes())
+
+    def stats(self):
+        with self._lock:
+            stats = {"entries_bytes": self._total_bytes, "max_bytes": self.max_bytes}
+            for kind in self.hits:
+                lookups = self.hits[kind] + self.misses[kind]
+                stats[kind] = {
+                    "hits": self.hits[kind],
+                    "misses": self.misses[kind],
+                    "hit_rate": self.hits[kind] / lookups if lookups else 0.0,
+                }
+            return stats
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _get(self, kind, key):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses[kind] += 1
+                return None
+            self.hits[kind] += 1
+            self._conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (time.time(), key))
+            return row[0]
+
+    def _put(self, kind, key, value):
+        size = len(value) + len(key)
+        with self._lock:
+            old = self._conn.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, kind, value, size, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, kind, sqlite3.Binary(value), size, time.time())
+            )
+            self._total_bytes += size - (old[0] if old else 0)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # Drop least recently used entries until we are back under 90% of the
+        # limit, so a full cache doesn't evict on every single insert
+        target = int(self.max_bytes * 0.9)
+        rows = self._conn.execute("SELECT key, size FROM entries ORDER BY last_access")
+        evicted = []
+        for key, size in rows:
+            if self._total_bytes <= target:
+                break
+            evicted.append((key,))
+            self._total_bytes -= size
+        self._conn.executemany("DELETE FROM entries WHERE key = ?", evicted)
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Process-wide ResultCache, or None when RESULT_CACHE_DISABLED is set."""
+    global _default_cache
+    if not CACHE_ENABLED:
+        return None
+    if _default_cache is None:
+        with _default_cache_lock:
+            if _default_cache is None:
+                _default_cache = ResultCache()
+    return _default_cache